@@ -2,7 +2,11 @@
 import os
 import subprocess
 import sys
+import asyncio
 from datetime import datetime
+from job_graph import build_pipeline
+import tracing
+import trace_report
 
 # --- Configuration ---
 SCRIPTS = [
@@ -17,35 +21,90 @@ SCRIPTS = [
     "morning_news_generator.py"
 ]
 
+# Starts as soon as its input reports exist (see job_graph.BRIEF_INPUTS), in parallel with the RSS aggregator
+BRIEF_SCRIPT = "morning_news_generator.py"
+
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", os.path.join(os.getcwd(), "output"))
+
+# "inprocess" (default) runs the scrapers one by one on a shared browser,
+# "concurrent" runs them in parallel (see SCRAPER_MAX_CONCURRENCY / SCRAPER_PER_HOST_LIMIT),
+# "subprocess" is the fallback
+RUN_MODE = os.getenv("RUN_MODE", "inprocess").lower()
+
+def run_subprocess(script, current_dir):
+    script_path = os.path.join(current_dir, script)
+    if not os.path.exists(script_path):
+        print(f"[!] Warning: {script} not found in {current_dir}")
+        raise FileNotFoundError(script_path)
+        
+    print(f"[*] Running {script}...")
+    # Use sys.executable to ensure the same python environment
+    result = subprocess.run([sys.executable, script_path], capture_output=True, text=True, encoding='utf-8', errors='replace')
+    if result.returncode == 0:
+        print(f"[+] Success: {script}")
+        # Print last part of output to show where report was saved
+        lines = result.stdout.strip().split('\n')
+        for line in lines:
+            if "Saved report to" in line:
+                print(f"    {line.strip()}")
+    else:
+        print(f"[-] Error in {script}:")
+        print(result.stderr)
+        raise RuntimeError(f"{script} exited with code {result.returncode}")
+
+def open_browser_pool():
+    """
+    Browser pool for the in-process modes. Returns (shared_browser, pool, host_slots),
+    or (None, None, None) in subprocess mode or when in-process mode is unavailable.
+    """
+    if RUN_MODE not in ("inprocess", "concurrent"):
+        return None, None, None
+    try:
+        import shared_browser
+    except ImportError as e:
+        print(f"[!] In-process mode unavailable ({e}). Falling back to subprocess mode.")
+        return None, None, None
+    pool, host_slots = shared_browser.open_pool(RUN_MODE, SCRIPTS)
+    return shared_browser, pool, host_slots
+
+async def run_pipeline(current_dir):
+    shared_browser, pool, host_slots = open_browser_pool()
+    # Subprocess-mode scrapers each launch their own Chromium, so keep them one at a time
+    subprocess_slot = asyncio.Semaphore(1)
+
+    async def run_script(script):
+        if pool and shared_browser.is_browser_script(script):
+            if not await shared_browser.run_bounded(pool, script, host_slots):
+                raise RuntimeError(f"{script} saved no report")
+        elif script == BRIEF_SCRIPT:
+            await asyncio.to_thread(run_subprocess, script, current_dir)
+        else:
+            async with subprocess_slot:
+                await asyncio.to_thread(run_subprocess, script, current_dir)
+
+    scripts = [s for s in SCRIPTS if s != BRIEF_SCRIPT]
+    graph = build_pipeline(scripts, run_script, brief_script=BRIEF_SCRIPT)
+    try:
+        await graph.run_async()
+    finally:
+        if pool:
+            pool.close()
+    graph.write_timeline(OUTPUT_DIR)
+
 def main():
     print(f"=== VNINDEX ALL-IN-ONE ANALYSIS RUNNER ===")
     print(f"Start Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Run Mode: {RUN_MODE}")
     print("-" * 40)
     
     current_dir = os.path.dirname(os.path.abspath(__file__))
+    # Exported through os.environ, so subprocess scrapers write spans into the same run
+    run_id = tracing.current_run_id()
     
-    for script in SCRIPTS:
-        script_path = os.path.join(current_dir, script)
-        if not os.path.exists(script_path):
-            print(f"[!] Warning: {script} not found in {current_dir}")
-            continue
-            
-        print(f"[*] Running {script}...")
-        try:
-            # Use sys.executable to ensure the same python environment
-            result = subprocess.run([sys.executable, script_path], capture_output=True, text=True, encoding='utf-8', errors='replace')
-            if result.returncode == 0:
-                print(f"[+] Success: {script}")
-                # Print last part of output to show where report was saved
-                lines = result.stdout.strip().split('\n')
-                for line in lines:
-                    if "Saved report to" in line:
-                        print(f"    {line.strip()}")
-            else:
-                print(f"[-] Error in {script}:")
-                print(result.stderr)
-        except Exception as e:
-            print(f"[!] Fatal error running {script}: {e}")
+    asyncio.run(run_pipeline(current_dir))
+    
+    print("-" * 40)
+    trace_report.record_run(run_id)
             
     print("-" * 40)
     print(f"End Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -0,0 +1,180 @@
+import os
+import re
+import math
+
+# --- Configuration ---
+# Token budget of each report in the brief prompt, and per-source overrides:
+# BRIEF_SOURCE_BUDGETS="[news summary]=6000,sector_data=1500" (source = latest/ name without .md)
+DEFAULT_BUDGET = int(os.getenv("BRIEF_TOKEN_BUDGET", "3000"))
+SOURCE_BUDGETS = {
+    name.strip(): int(tokens)
+    for name, tokens in (item.split("=", 1) for item in os.getenv("BRIEF_SOURCE_BUDGETS", "").split(",") if "=" in item)
+}
+# Article bodies of the news reports are cut to this many characters
+ARTICLE_MAX_CHARS = int(os.getenv("BRIEF_ARTICLE_CHARS", "500"))
+# Rough tokens-per-byte for Vietnamese/English Markdown; only used for budgets and logging
+BYTES_PER_TOKEN = 4
+
+SEPARATOR_CELL = re.compile(r"^:?-{3,}:?$")
+BODY_START = re.compile(r"^- \*\*(Content|Nội dung)\*\*:\s*(.*)$")
+DROPPED_LINE = re.compile(r"^(Source:|- \*\*Link\*\*:|-{3,}$)")
+
+def estimate_tokens(text):
+    return math.ceil(len(text.encode("utf-8")) / BYTES_PER_TOKEN)
+
+def budget_for(source):
+    return SOURCE_BUDGETS.get(source, DEFAULT_BUDGET)
+
+def plain(text):
+    """Drop Markdown emphasis and collapse whitespace."""
+    return re.sub(r"\s+", " ", text.replace("**", "").replace("*", "")).strip()
+
+def csv_cell(cell):
+    return f'"{cell}"' if "," in cell else cell
+
+def table_cells(line):
+    return [plain(c) for c in line.strip().strip("|").split("|")]
+
+def compact_report(content, seen_titles=None):
+    """
+    A report in compact form, as lines:
+        headings   -> "## Title" kept, with the level
+        tables     -> one "a,b,c" line per row, separator rows dropped; the old
+                      "| Row | Content |" wrapper loses its row-number column
+        articles   -> title and time kept, link dropped, body cut to ARTICLE_MAX_CHARS
+    A section that repeats an earlier one exactly is dropped (repeated rows inside a section
+    are data and stay), and so are articles whose title is in `seen_titles` (shared across
+    reports, so a story carried by two feeds appears once).
+    """
+    seen_titles = seen_titles if seen_titles is not None else set()
+    lines = []
+    row_wrapper = False
+    body = None
+    skipping_article = False
+
+    def emit(line):
+        if line:
+            lines.append(line)
+
+    def end_body():
+        if body is not None and not skipping_article:
+            text = plain(" ".join(body))
+            if len(text) > ARTICLE_MAX_CHARS:
+                text = text[:ARTICLE_MAX_CHARS].rsplit(" ", 1)[0] + " …"
+            emit(text)
+
+    for raw in content.splitlines():
+        line = raw.strip()
+        if body is not None:
+            if re.match(r"^-{3,}$", line) or line.startswith("#"):
+                end_body()
+                body = None
+            else:
+                body.append(line)
+                continue
+        if not line:
+            continue
+
+        if line.startswith("#"):
+            level = len(line) - len(line.lstrip("#"))
+            title = plain(line.lstrip("#"))
+            # Article headings (### 1. Title / ### [10:00] [CafeF] Title) are deduplicated across reports
+            if level >= 3 and re.match(r"^(\d+\.|\[)", title):
+                key = re.sub(r"^(\d+\.\s*|(\[[^\]]*\]\s*)+)", "", title).lower()
+                skipping_article = key in seen_titles
+                seen_titles.add(key)
+                if skipping_article:
+                    continue
+            else:
+                skipping_article = False
+            emit(f"{'#' * min(level, 3)} {title}")
+            continue
+        if skipping_article:
+            match = BODY_START.match(line)
+            if match:
+                body = [match.group(2)]
+            continue
+
+        if line.startswith("|"):
+            cells = table_cells(line)
+            if all(SEPARATOR_CELL.match(c) for c in cells if c):
+                continue
+            if cells[:2] == ["Row", "Content"]:
+                row_wrapper = True
+                continue
+            if row_wrapper and cells and cells[0].isdigit():
+                cells = cells[1:]
+            emit(",".join(csv_cell(c) for c in cells))
+            continue
+        row_wrapper = False
+
+        match = BODY_START.match(line)
+        if match:
+            body = [match.group(2)]
+            continue
+        if DROPPED_LINE.match(line):
+            continue
+        emit(plain(re.sub(r"^- ", "", line)))
+
+    if body is not None:
+        end_body()
+    return drop_repeated_sections(lines)
+
+def drop_repeated_sections(lines):
+    """Drop every section (a heading and the lines up to the next one) identical to an earlier section."""
+    sections = []
+    for line in lines:
+        if line.startswith("#") or not sections:
+            sections.append([])
+        sections[-1].append(line)
+    kept = []
+    seen = set()
+    for section in sections:
+        key = "\n".join(section)
+        if key not in seen:
+            seen.add(key)
+            kept.extend(section)
+    return kept
+
+def fit_budget(lines, budget):
+    """Keep whole lines, in order, while they fit in `budget` tokens."""
+    kept = []
+    used = 0
+    for line in lines:
+        cost = estimate_tokens(line + "\n")
+        if used + cost > budget:
+            kept.append(f"[... {len(lines) - len(kept)} more lines cut to fit {budget} tokens]")
+            break
+        kept.append(line)
+        used += cost
+    return kept
+
+def source_name(name):
+    return os.path.splitext(os.path.basename(name))[0]
+
+def compact_sources(reports):
+    """
+    Every report of [(name, Markdown)] compacted and held to its source's token budget,
+    as [(source, text)]. Logs the estimated token count of each source before and after.
+    """
+    sources = []
+    seen_titles = set()
+    before_total = after_total = 0
+    for name, content in reports:
+        source = source_name(name)
+        text = "\n".join(fit_budget(compact_report(content, seen_titles), budget_for(source)))
+        before, after = estimate_tokens(content), estimate_tokens(text)
+        before_total += before
+        after_total += after
+        print(f"   [ctx] {source}: ~{before} -> ~{after} tokens (budget {budget_for(source)})")
+        sources.append((source, text))
+    saved = 100 * (1 - after_total / before_total) if before_total else 0
+    print(f"   [ctx] Data context: ~{before_total} -> ~{after_total} tokens ({saved:.0f}% smaller)")
+    return sources
+
+def join_sources(sources):
+    return "\n".join(f"--- FILE: {source} ---\n{text}\n" for source, text in sources)
+
+def build_context(reports):
+    """The brief's data context from [(name, Markdown)]: see compact_sources."""
+    return join_sources(compact_sources(reports))
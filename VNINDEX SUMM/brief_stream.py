@@ -0,0 +1,66 @@
+import re
+import json
+
+DIALOGUE_START = re.compile(r'"dialogue"\s*:\s*\[')
+
+class DialogueStreamParser:
+    """
+    Incremental parser for the script response {"dialogue": [{"speaker": ..., "text": ...}, ...]}.
+    feed() takes the response as it streams in (code fences and all) and returns the turns
+    completed by that piece, so each can go to TTS before the rest of the script is written.
+        parser = DialogueStreamParser()
+        for piece in model.generate_stream(prompt):
+            for turn in parser.feed(piece):
+                ...
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.turns = []
+        self.pos = None       # next character to scan, once inside the dialogue array
+        self.start = None     # where the turn being read began
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.done = False
+
+    def feed(self, piece):
+        self.text += piece
+        if self.pos is None:
+            match = DIALOGUE_START.search(self.text)
+            if not match:
+                return []
+            self.pos = match.end()
+        completed = []
+        while self.pos < len(self.text) and not self.done:
+            ch = self.text[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                if self.depth == 0:
+                    self.start = self.pos
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        turn = json.loads(self.text[self.start:self.pos + 1])
+                        self.turns.append(turn)
+                        completed.append(turn)
+                    except ValueError as e:
+                        print(f"   [!] Skipping unreadable turn: {e}")
+            elif ch == "]" and self.depth == 0:
+                self.done = True
+            self.pos += 1
+        return completed
+
+    def result(self):
+        """The script read so far as {"dialogue": [...]}, or None if no turn was found."""
+        return {"dialogue": self.turns} if self.turns else None
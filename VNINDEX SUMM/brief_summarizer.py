@@ -0,0 +1,109 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tracing import span
+
+# --- Configuration ---
+# BRIEF_PRESUMMARIZE=0 sends the compacted reports straight to the script model (one call, as before)
+PRESUMMARIZE = os.getenv("BRIEF_PRESUMMARIZE", "1") != "0"
+# Fast model for the per-report fact sheets, how many run at once, and the size of each sheet
+FACT_MODEL = os.getenv("BRIEF_FACT_MODEL", "gemini-2.5-flash")
+FACT_CONCURRENCY = int(os.getenv("BRIEF_FACT_CONCURRENCY", "4"))
+FACT_SHEET_WORDS = int(os.getenv("BRIEF_FACT_SHEET_WORDS", "150"))
+# BRIEF_MODEL_BACKEND=stub answers every model call locally (offline runs of the whole brief)
+MODEL_BACKEND = os.getenv("BRIEF_MODEL_BACKEND", "gemini").lower()
+# Seconds between the stub's streamed pieces, to mimic a model writing (BRIEF_MODEL_BACKEND=stub)
+STUB_STREAM_DELAY = float(os.getenv("BRIEF_STUB_STREAM_DELAY", "0"))
+SCRAPER = "morning_brief"
+
+FACT_PROMPT = """Bạn là chuyên viên phân tích tài chính. Tóm tắt báo cáo dưới đây thành một bảng dữ kiện
+cho bản tin chứng khoán buổi sáng, tối đa {words} từ.
+- Chỉ giữ các dữ kiện quan trọng nhất: chỉ số, thanh khoản, khối ngoại, tự doanh, mã nổi bật, tin vĩ mô.
+- Giữ nguyên con số, đơn vị và mã cổ phiếu; không làm tròn, không suy đoán, không bình luận.
+- Mỗi dữ kiện một dòng, bắt đầu bằng "- ".
+
+NGUỒN: {source}
+{content}"""
+
+class GeminiModel:
+    """A Gemini model; genai.configure() must have been called."""
+
+    def __init__(self, name):
+        import google.generativeai as genai
+        self.name = name
+        self.model = genai.GenerativeModel(name)
+
+    def generate(self, prompt):
+        return self.model.generate_content(prompt).text
+
+    def generate_stream(self, prompt):
+        """Yield the response text piece by piece as the model writes it."""
+        for chunk in self.model.generate_content(prompt, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+class StubModel:
+    """
+    Offline stand-in with the same interface. A fact-sheet prompt gets the first lines of its
+    report back; any other prompt (the script) gets a short two-speaker dialogue in the JSON format.
+    """
+
+    def __init__(self, name):
+        self.name = f"stub:{name}"
+
+    def generate(self, prompt):
+        if prompt.startswith(FACT_PROMPT[:40]):
+            content = prompt.split("\nNGUỒN: ", 1)[1].split("\n", 1)[-1]
+            return "\n".join(f"- {line[2:] if line.startswith('- ') else line}" for line in content.splitlines()[:10] if line.strip())
+        data = prompt.split("--- FILE:", 1)[-1]
+        lines = [line for line in data.splitlines() if line.startswith("- ")][:4] or ["- Thị trường hôm nay."]
+        dialogue = [{"speaker": "Mai" if i % 2 == 0 else "Hùng", "text": line[2:]} for i, line in enumerate(lines)]
+        return json.dumps({"dialogue": dialogue}, ensure_ascii=False)
+
+    def generate_stream(self, prompt):
+        text = "```json\n" + self.generate(prompt) + "\n```"
+        for i in range(0, len(text), 40):
+            time.sleep(STUB_STREAM_DELAY)
+            yield text[i:i + 40]
+
+def make_model(name):
+    return StubModel(name) if MODEL_BACKEND == "stub" else GeminiModel(name)
+
+def limit_words(text, words):
+    """Cut `text` to `words` words, keeping whole lines where possible."""
+    kept = []
+    count = 0
+    for line in text.strip().splitlines():
+        n = len(line.split())
+        if count + n > words:
+            if not kept:
+                kept.append(" ".join(line.split()[:words]) + " …")
+            break
+        kept.append(line)
+        count += n
+    return "\n".join(kept)
+
+def fact_sheet(model, source, text):
+    """One report's fact sheet; the compacted report itself (cut to size) if the model call fails."""
+    try:
+        with span(SCRAPER, "fact_sheet", source=source, model=model.name):
+            sheet = model.generate(FACT_PROMPT.format(words=FACT_SHEET_WORDS, source=source, content=text))
+        return limit_words(sheet, FACT_SHEET_WORDS)
+    except Exception as e:
+        print(f"   [!] Fact sheet failed for {source} ({e}); using the compacted report")
+        return limit_words(text, FACT_SHEET_WORDS)
+
+def summarize_sources(sources, model_name=FACT_MODEL, workers=FACT_CONCURRENCY):
+    """
+    Map step of the brief: [(source, text)] -> [(source, fact sheet)], in the same order,
+    with at most `workers` model calls in flight.
+    """
+    if not sources:
+        return []
+    model = make_model(model_name)
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(sources))), thread_name_prefix="facts") as executor:
+        sheets = list(executor.map(lambda item: fact_sheet(model, *item), sources))
+    print(f"   [+] {len(sheets)} fact sheets from {model.name} in {time.perf_counter() - t0:.2f}s ({workers} at a time)")
+    return list(zip((source for source, _ in sources), sheets))
@@ -0,0 +1,166 @@
+import io
+import os
+import math
+import time
+import wave
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from tracing import span
+
+# --- Configuration ---
+# BRIEF_TTS_MODE=turns synthesizes the dialogue chunk by chunk, concurrently, and stitches the WAV
+# locally; "long" (default) submits it as one Long Audio job
+TTS_MODE = os.getenv("BRIEF_TTS_MODE", "long").lower()
+TTS_WORKERS = int(os.getenv("BRIEF_TTS_WORKERS", "6"))
+TURNS_PER_CHUNK = int(os.getenv("BRIEF_TTS_TURNS_PER_CHUNK", "1"))
+# BRIEF_TTS_BACKEND=fake makes tones instead of calling Cloud TTS (offline runs); the fake
+# takes BRIEF_FAKE_TTS_DELAY seconds per chunk, like a network call
+TTS_BACKEND = os.getenv("BRIEF_TTS_BACKEND", "google").lower()
+FAKE_DELAY = float(os.getenv("BRIEF_FAKE_TTS_DELAY", "0.2"))
+SCRAPER = "morning_brief"
+SAMPLE_WIDTH = 2  # LINEAR16
+CHANNELS = 1
+
+class GoogleTts:
+    """Standard (non-Long Audio) Cloud TTS: one synthesize_speech call per chunk of turns."""
+
+    def __init__(self, language, model_name, voices, sample_rate):
+        from google.cloud import texttospeech
+        from google.cloud.texttospeech_v1.types import MultiSpeakerMarkup, MultiSpeakerVoiceConfig, MultispeakerPrebuiltVoice
+        self.texttospeech = texttospeech
+        self.MultiSpeakerMarkup = MultiSpeakerMarkup
+        self.client = texttospeech.TextToSpeechClient()
+        self.voice = texttospeech.VoiceSelectionParams(
+            language_code=language,
+            model_name=model_name,
+            multi_speaker_voice_config=MultiSpeakerVoiceConfig(speaker_voice_configs=[
+                MultispeakerPrebuiltVoice(speaker_alias=alias, speaker_id=voice_id)
+                for alias, voice_id in voices.items()
+            ])
+        )
+        self.audio_config = texttospeech.AudioConfig(
+            audio_encoding=texttospeech.AudioEncoding.LINEAR16,
+            sample_rate_hertz=sample_rate
+        )
+
+    def synthesize(self, turns):
+        markup = self.MultiSpeakerMarkup(turns=[self.MultiSpeakerMarkup.Turn(speaker=alias, text=text) for alias, text in turns])
+        response = self.client.synthesize_speech(
+            input=self.texttospeech.SynthesisInput(multi_speaker_markup=markup),
+            voice=self.voice,
+            audio_config=self.audio_config
+        )
+        return response.audio_content
+
+class FakeTts:
+    """Offline stand-in: a short tone per turn (pitch by speaker, length by text), as a WAV."""
+
+    def __init__(self, language, model_name, voices, sample_rate):
+        self.voices = list(voices)
+        self.sample_rate = sample_rate
+
+    def synthesize(self, turns):
+        time.sleep(FAKE_DELAY)
+        frames = bytearray()
+        for alias, text in turns:
+            pitch = 220 if self.voices.index(alias) % 2 == 0 else 140
+            samples = int(self.sample_rate * min(0.05 * len(text.split()) + 0.2, 5))
+            for i in range(samples):
+                frames += struct.pack("<h", int(3000 * math.sin(2 * math.pi * pitch * i / self.sample_rate)))
+        return wav_bytes(bytes(frames), self.sample_rate)
+
+def make_tts(language, model_name, voices, sample_rate):
+    backend = FakeTts if TTS_BACKEND == "fake" else GoogleTts
+    return backend(language, model_name, voices, sample_rate)
+
+def wav_bytes(pcm, sample_rate):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(CHANNELS)
+        w.setsampwidth(SAMPLE_WIDTH)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm)
+    return buffer.getvalue()
+
+def pcm_frames(audio, sample_rate):
+    """The PCM frames of a LINEAR16 response (a WAV file, or raw samples without a header)."""
+    if audio[:4] != b"RIFF":
+        return audio
+    with wave.open(io.BytesIO(audio), "rb") as w:
+        if (w.getnchannels(), w.getsampwidth(), w.getframerate()) != (CHANNELS, SAMPLE_WIDTH, sample_rate):
+            raise ValueError(f"unexpected audio format {w.getparams()}")
+        return w.readframes(w.getnframes())
+
+class TurnSynthesizer:
+    """
+    The synthesis queue. Turns are added as they become available: all at once, or one by one
+    while the script is still streaming in. Every full chunk of `turns_per_chunk` turns starts
+    right away on a pool of `workers`. finish() joins the PCM in dialogue order, so the wait
+    after the last turn is about one chunk rather than the whole dialogue.
+    Use it as a context manager (or call close()) so a failed run does not leave chunks running.
+    """
+
+    def __init__(self, tts, sample_rate, workers=TTS_WORKERS, turns_per_chunk=TURNS_PER_CHUNK):
+        self.tts = tts
+        self.sample_rate = sample_rate
+        self.workers = max(1, workers)
+        self.turns_per_chunk = max(1, turns_per_chunk)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tts")
+        self.pending = []
+        self.futures = []
+        self.started = time.perf_counter()
+        self.last_added = self.started
+
+    def _synthesize(self, n, part):
+        with span(SCRAPER, "tts_chunk", chunk=n, turns=len(part)):
+            return pcm_frames(self.tts.synthesize(part), self.sample_rate)
+
+    def _submit(self, part):
+        self.futures.append(self.executor.submit(self._synthesize, len(self.futures), part))
+
+    def add(self, turns):
+        """Queue [(speaker alias, text)]; full chunks are submitted immediately."""
+        self.pending.extend(turns)
+        self.last_added = time.perf_counter()
+        while len(self.pending) >= self.turns_per_chunk:
+            self._submit(self.pending[:self.turns_per_chunk])
+            self.pending = self.pending[self.turns_per_chunk:]
+
+    def finish(self):
+        """PCM of the whole dialogue, once every chunk is synthesized."""
+        if self.pending:
+            self._submit(self.pending)
+            self.pending = []
+        try:
+            pcm = [future.result() for future in self.futures]
+        except Exception:
+            self.close()
+            raise
+        self.executor.shutdown(wait=True)
+        now = time.perf_counter()
+        print(f"   [+] {len(self.futures)} TTS chunks synthesized in {now - self.started:.2f}s "
+              f"({now - self.last_added:.2f}s after the last turn, {self.workers} at a time)")
+        return b"".join(pcm)
+
+    def close(self):
+        """Cancel the chunks that have not started and release the pool (no-op after finish())."""
+        self.pending = []
+        for future in self.futures:
+            future.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def write_wav(pcm, path, sample_rate):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(CHANNELS)
+        w.setsampwidth(SAMPLE_WIDTH)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm)
+    seconds = len(pcm) / (SAMPLE_WIDTH * CHANNELS * sample_rate)
+    print(f"   [+] Stitched {seconds:.1f}s of audio into {path}")
+    return path
@@ -1,10 +1,19 @@
 import os
 import subprocess
 import sys
-import glob
 import re
+import json
+import hashlib
+import asyncio
+import threading
 from datetime import datetime
-from google.cloud import storage
+from job_graph import build_pipeline
+import tracing
+import trace_report
+import snapshot_store
+import report_schema
+import storage_backend
+from gcs_publisher import Publisher
 
 # --- Configuration ---
 # Match the list from VNINDEX_SUMM_RUN.py
@@ -19,111 +28,318 @@ SCRIPTS = [
     # "rss_news_aggregator.py" # Optional: decide if this should run too
 ]
 
-BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
+# Starts as soon as the reports it reads from latest/ are published (see job_graph.BRIEF_INPUTS)
+BRIEF_SCRIPT = "morning_news_generator.py"
+
+BUCKET_NAME = os.getenv("GCS_BUCKET_NAME") or ("local" if storage_backend.BACKEND == "local" else None)
 # If not set, we can optionally warn or skip upload (useful for local testing)
 
-def upload_to_gcs(local_path, destination_blob_name):
-    """Uploads a file to the bucket."""
+# "inprocess" (default) runs the scrapers one by one on a shared browser,
+# "concurrent" runs them in parallel (see SCRAPER_MAX_CONCURRENCY / SCRAPER_PER_HOST_LIMIT),
+# "subprocess" is the fallback
+RUN_MODE = os.getenv("RUN_MODE", "inprocess").lower()
+
+# Run-history of per-stage timings kept in the bucket, so p50/p95 survive the ephemeral /tmp
+PERF_FOLDER = "dailyVnindexdata/perf"
+# Append-only snapshot store (snapshot_store.py), carried from run to run through the bucket
+STORE_BLOB = f"dailyVnindexdata/history/{snapshot_store.DB_FILENAME}"
+# Data fingerprint of every report in latest/, so a report whose data did not change is not uploaded
+# again. FORCE_PUBLISH=1 ignores it. (The brief decides on its own whether its inputs changed,
+# see brief_cache_key in morning_news_generator.py.)
+MANIFEST_BLOB = "dailyVnindexdata/publish_manifest.json"
+FORCE_PUBLISH = os.getenv("FORCE_PUBLISH", "0") == "1"
+
+manifest = {"reports": {}}
+savings = {"reports": 0, "files": 0, "bytes": 0, "calls": 0}
+_manifest_lock = threading.Lock()
+
+# One storage client and pool for the whole run (see storage_backend.py)
+publisher = Publisher(BUCKET_NAME)
+
+def upload_to_gcs(local_path, destination_blob_name, content_type='text/markdown; charset=utf-8'):
+    """Uploads a file to the bucket. Returns True once it is uploaded."""
     if not BUCKET_NAME:
         print(f"[Warn] No GCS_BUCKET_NAME set. Skipping upload for {local_path}")
+        return False
+    return publisher.upload(local_path, destination_blob_name, content_type)
+
+def download_perf_history():
+    """Fetch the stored run history so this run's report covers previous runs too."""
+    if not BUCKET_NAME:
         return
+    try:
+        os.makedirs(tracing.trace_dir(), exist_ok=True)
+        publisher.backend.download_file(f"{PERF_FOLDER}/{trace_report.HISTORY_FILENAME}", trace_report.history_path())
+    except Exception as e:
+        print(f"[Warn] Could not download perf history: {e}")
 
+def download_snapshot_store():
+    """Fetch the stored snapshot history, so this run's scrapers append to it."""
+    if not BUCKET_NAME:
+        return
     try:
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(BUCKET_NAME)
-        blob = bucket.blob(destination_blob_name)
-        # Explicitly set UTF-8 content type to fix browser rendering issues
-        blob.upload_from_filename(local_path, content_type='text/markdown; charset=utf-8')
-        print(f"[Cloud] Uploaded {local_path} to gs://{BUCKET_NAME}/{destination_blob_name}")
+        if publisher.backend.download_file(STORE_BLOB, snapshot_store.db_path()):
+            print(f"[Cloud] Downloaded snapshot store {publisher.backend.uri(STORE_BLOB)}")
     except Exception as e:
-        print(f"[Error] Failed to upload {local_path}: {e}")
+        print(f"[Warn] Could not download snapshot store: {e}")
+
+def publish_snapshot_store():
+    if os.path.exists(snapshot_store.db_path()):
+        upload_to_gcs(snapshot_store.db_path(), STORE_BLOB, content_type='application/vnd.sqlite3')
+
+def download_manifest():
+    """Fetch the fingerprints of what latest/ holds from the previous runs."""
+    if not BUCKET_NAME:
+        return
+    try:
+        manifest.update(json.loads(publisher.backend.read_text(MANIFEST_BLOB, default="{}")))
+        # Written by earlier runs, when the runner also decided whether to skip the brief
+        manifest.pop("brief_inputs", None)
+    except Exception as e:
+        print(f"[Warn] Could not download publish manifest: {e}")
+
+def publish_manifest():
+    path = os.path.join(os.environ["OUTPUT_DIR"], os.path.basename(MANIFEST_BLOB))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    upload_to_gcs(path, MANIFEST_BLOB, content_type='application/json; charset=utf-8')
+
+def report_fingerprint(local_file):
+    """
+    The data fingerprint of a report: the one in its .json (report_schema.fingerprint), else
+    a hash of its Markdown without the first line, which carries the generation timestamp.
+    """
+    data_file = os.path.splitext(local_file)[0] + ".json"
+    if os.path.exists(data_file):
+        with open(data_file, "r", encoding="utf-8") as f:
+            fingerprint = json.load(f).get("fingerprint")
+        if fingerprint:
+            return fingerprint
+    with open(local_file, "r", encoding="utf-8") as f:
+        lines = f.read().split("\n")
+    if lines[0].startswith("# "):
+        lines = lines[1:]
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+def print_savings():
+    print(f"[Cloud] Unchanged reports skipped: {savings['files']} file(s), "
+          f"{savings['calls']} API call(s), {savings['bytes'] / 1024:.1f} KB")
+    tracing.emit_span("cloud_runner", "publish_skipped", 0, files=savings["files"], calls=savings["calls"],
+                      bytes=savings["bytes"])
+
+def publish_traces(run_id):
+    """Summarize this run's spans into the history and upload both."""
+    trace_report.record_run(run_id)
+    spans_file = tracing.spans_path(run_id)
+    if os.path.exists(spans_file):
+        upload_to_gcs(spans_file, f"{PERF_FOLDER}/{os.path.basename(spans_file)}", content_type='application/x-ndjson')
+    if os.path.exists(trace_report.history_path()):
+        upload_to_gcs(trace_report.history_path(), f"{PERF_FOLDER}/{trace_report.HISTORY_FILENAME}", content_type='application/x-ndjson')
+
+def latest_name(file_name):
+    # Regex to remove datetime pattern (e.g., _0415 or _20260115) from the end of filename
+    # Pattern: look for _\d{4}.md or _\d{8}.md (or .json) at the end
+    clean_name = re.sub(r'_\d{4}\.(md|json)$', r'.\1', file_name)
+    return re.sub(r'_\d{8}\.(md|json)$', r'.\1', clean_name)
+
+def report_tasks(local_file, base_folder="dailyVnindexdata"):
+    """
+    Publisher tasks for a report and the .json data file saved next to it (see report_schema.py):
+    each is uploaded to its dated archive path and copied to its latest/ alias.
+    Returns (latest name, fingerprint, tasks); no tasks when latest/ already holds the same data.
+    """
+    name = latest_name(os.path.basename(local_file))
+    fingerprint = report_fingerprint(local_file)
+    data_file = os.path.splitext(local_file)[0] + ".json"
+    files = [(local_file, 'text/markdown; charset=utf-8')]
+    if local_file.endswith(".md") and os.path.exists(data_file):
+        files.append((data_file, 'application/json; charset=utf-8'))
+
+    with _manifest_lock:
+        previous = manifest["reports"].get(name)
+        unchanged = not FORCE_PUBLISH and previous is not None and previous["fingerprint"] == fingerprint
+        if unchanged:
+            # Each file would have been uploaded once and copied once
+            savings["reports"] += 1
+            savings["files"] += len(files)
+            savings["calls"] += 2 * len(files)
+            savings["bytes"] += sum(os.path.getsize(f) for f, _ in files)
+    if unchanged:
+        print(f"[Cloud] {name} unchanged since {previous['published_at']}, skipping upload")
+        return name, fingerprint, []
+
+    # Archive Path: dailyVnindexdata/YYYY/MM/DD/filename
+    # Latest Path: dailyVnindexdata/latest/filename_without_timestamp
+    archive_folder = f"{base_folder}/{datetime.now().strftime('%Y/%m/%d')}"
+    tasks = [(path, f"{archive_folder}/{os.path.basename(path)}",
+              [f"{base_folder}/latest/{latest_name(os.path.basename(path))}"], content_type)
+             for path, content_type in files]
+    return name, fingerprint, tasks
+
+def publish_reports(local_files, base_folder="dailyVnindexdata"):
+    """Publish several reports at once; all their uploads share the publisher's pool. Returns the number uploaded."""
+    if not local_files:
+        return 0
+    if not BUCKET_NAME:
+        print(f"[Warn] No GCS_BUCKET_NAME set. Skipping upload for {len(local_files)} report(s)")
+        return 0
+    planned = [report_tasks(local_file, base_folder) for local_file in local_files]
+    results = iter(publisher.publish([task for _, _, tasks in planned for task in tasks]))
+    uploaded = 0
+    for name, fingerprint, tasks in planned:
+        if tasks and all([next(results) for _ in tasks]):
+            uploaded += 1
+            with _manifest_lock:
+                manifest["reports"][name] = {"fingerprint": fingerprint, "published_at": datetime.now().isoformat(timespec="seconds")}
+    return uploaded
+
+def publish_report(local_file, base_folder="dailyVnindexdata"):
+    """Upload a report (and its .json) to its dated archive path and its latest/ alias. Returns 1 if uploaded."""
+    return publish_reports([local_file], base_folder)
+
+def resolve_script_path(script, current_dir):
+    script_path = os.path.join(current_dir, script)
+    
+    if not os.path.exists(script_path):
+         # Fallback: maybe scripts are in /app but WORKDIR is /tmp
+         # Let's try to assume scripts are in /app if current dir is /tmp
+         if current_dir == "/tmp" and os.path.exists(f"/app/{script}"):
+             script_path = f"/app/{script}"
+         elif os.path.exists(os.path.join(os.path.dirname(__file__), script)):
+             script_path = os.path.join(os.path.dirname(__file__), script)
+    return script_path
+
+def run_subprocess(script, current_dir, check=False):
+    """
+    Run a script in its own interpreter. Returns the report paths it printed as saved.
+    With check=True a missing script or a non-zero exit raises RuntimeError instead.
+    """
+    print(f"\n>>> Running {script}...")
+    script_path = resolve_script_path(script, current_dir)
+
+    if not os.path.exists(script_path):
+        print(f"[!] Script not found: {script}")
+        if check:
+            raise RuntimeError(f"{script} not found")
+        return []
+
+    try:
+        # Run the script
+        # We pass current env which includes OUTPUT_DIR
+        result = subprocess.run(
+            [sys.executable, script_path],
+            capture_output=True,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            env=os.environ
+        )
+        
+        print(result.stdout)
+        if result.returncode != 0:
+            print(f"[!] Error executing {script}:")
+            print(result.stderr)
+    except Exception as e:
+        print(f"[!] Exception running {script}: {e}")
+        if check:
+            raise RuntimeError(f"{script} could not be run: {e}") from e
+        return []
+    if check and result.returncode != 0:
+        raise RuntimeError(f"{script} exited with code {result.returncode}")
+    return [p.strip() for p in re.findall(r"Saved (?:report|summary) to (.+)", result.stdout)]
+
+def open_browser_pool():
+    """
+    Browser pool for the in-process modes. Returns (shared_browser, pool, host_slots),
+    or (None, None, None) in subprocess mode or when in-process mode is unavailable.
+    """
+    if RUN_MODE not in ("inprocess", "concurrent"):
+        return None, None, None
+    try:
+        # Scrapers are imported only now, so they pick up OUTPUT_DIR set by run_scripts()
+        import shared_browser
+    except ImportError as e:
+        print(f"[!] In-process mode unavailable ({e}). Falling back to subprocess mode.")
+        return None, None, None
+    pool, host_slots = shared_browser.open_pool(RUN_MODE, SCRIPTS)
+    return shared_browser, pool, host_slots
+
+async def run_pipeline(current_dir):
+    """Run scrapers and the brief as a job graph; each report is published as soon as it is saved."""
+    shared_browser, pool, host_slots = open_browser_pool()
+    # Subprocess-mode scrapers each launch their own Chromium, so keep them one at a time
+    subprocess_slot = asyncio.Semaphore(1)
+    published = set()
+    counts = {"uploaded": 0}
+
+    async def run_script(script):
+        if script == BRIEF_SCRIPT:
+            # The generator reuses its cached script and audio when its inputs are unchanged;
+            # check=True marks the job failed when it exits non-zero
+            await asyncio.to_thread(run_subprocess, script, current_dir, True)
+            return
+
+        if pool and shared_browser.is_browser_script(script):
+            paths = [await shared_browser.run_bounded(pool, script, host_slots)]
+        else:
+            async with subprocess_slot:
+                paths = await asyncio.to_thread(run_subprocess, script, current_dir)
+        paths = [p for p in paths if p]
+        if not paths:
+            raise RuntimeError(f"{script} saved no report")
+        counts["uploaded"] += await asyncio.to_thread(publish_reports, paths)
+        published.update(os.path.abspath(path) for path in paths)
+
+    graph = build_pipeline(SCRIPTS, run_script, brief_script=BRIEF_SCRIPT)
+    try:
+        await graph.run_async()
+    finally:
+        if pool:
+            pool.close()
+    graph.write_timeline(os.environ["OUTPUT_DIR"])
+    return published, counts["uploaded"]
 
 def run_scripts():
     print(f"=== CLOUD RUNNER START: {datetime.now()} ===")
     
     current_dir = os.getcwd()
     print(f"Working Directory: {current_dir}")
+    print(f"Run Mode: {RUN_MODE}")
 
     # Set OUTPUT_DIR for tradingview script if not set
     # We want everything in current_dir (which will be /tmp in Cloud Run)
     if "OUTPUT_DIR" not in os.environ:
         os.environ["OUTPUT_DIR"] = current_dir
 
-    for script in SCRIPTS:
-        print(f"\n>>> Running {script}...")
-        script_path = os.path.join(current_dir, script)
-        
-        if not os.path.exists(script_path):
-             # Fallback: maybe scripts are in /app but WORKDIR is /tmp
-             # Let's try to assume scripts are in /app if current dir is /tmp
-             if current_dir == "/tmp" and os.path.exists(f"/app/{script}"):
-                 script_path = f"/app/{script}"
-             elif os.path.exists(os.path.join(os.path.dirname(__file__), script)):
-                 script_path = os.path.join(os.path.dirname(__file__), script)
-
-        if not os.path.exists(script_path):
-            print(f"[!] Script not found: {script}")
-            continue
-
-        try:
-            # Run the script
-            # We pass current env which includes OUTPUT_DIR
-            result = subprocess.run(
-                [sys.executable, script_path],
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                errors='replace',
-                env=os.environ
-            )
-            
-            print(result.stdout)
-            if result.returncode != 0:
-                print(f"[!] Error executing {script}:")
-                print(result.stderr)
-        except Exception as e:
-            print(f"[!] Exception running {script}: {e}")
-
-    print("\n>>> Analysis Phase Complete. Starting Upload Phase...")
-
-    # Recursively find all .md files in the current directory (or subdirs)
-    # Since scripts create subfolders like YYYYMMDD/file.md
-    files_to_upload = glob.glob("**/*.md", recursive=True)
-    
-    # Filter out requirements or readme if any (unlikely in /tmp)
-    
-    today = datetime.now()
-    year_str = today.strftime("%Y")
-    month_str = today.strftime("%m")
-    day_str = today.strftime("%d")
-    
-    # Base folder in bucket
-    base_folder = "dailyVnindexdata"
-    uploaded_count = 0
+    # Exported through os.environ, so subprocess scrapers write spans into the same run
+    run_id = tracing.current_run_id()
+    print(f"Trace Run ID: {run_id}")
+    download_perf_history()
+    download_snapshot_store()
+    download_manifest()
 
-    for local_file in files_to_upload:
-        file_name = os.path.basename(local_file)
-        
-        # 1. Archive Path: dailyVnindexdata/YYYY/MM/DD/filename
-        archive_path = f"{base_folder}/{year_str}/{month_str}/{day_str}/{file_name}"
-        
-        # 2. Latest Path: dailyVnindexdata/latest/filename_without_timestamp
-        # Regex to remove datetime pattern (e.g., _0415 or _20260115) from the end of filename
-        # Pattern: look for _\d{4}.md or _\d{8}.md at the end
-        clean_name = re.sub(r'_\d{4}\.md$', '.md', file_name) 
-        clean_name = re.sub(r'_\d{8}\.md$', '.md', clean_name)
-        
-        latest_path = f"{base_folder}/latest/{clean_name}"
-        
-        # Upload to Archive
-        upload_to_gcs(local_file, archive_path)
-        
-        # Upload to Latest
-        upload_to_gcs(local_file, latest_path)
-        
-        uploaded_count += 1
+    published, uploaded_count = asyncio.run(run_pipeline(current_dir))
+
+    print("\n>>> Analysis Phase Complete. Uploading remaining reports...")
+
+    # Exactly the reports this run's scrapers saved (report_schema run manifest); stale
+    # files left in a reused output folder are never picked up
+    saved = report_schema.saved_reports(os.environ["OUTPUT_DIR"], run_id)
+    # Reports saved by the pipeline jobs were already published
+    remaining = [path for path in saved if os.path.abspath(path) not in published]
+    uploaded_count += publish_reports(remaining)
+
+    publish_snapshot_store()
+    print_savings()
+    publish_manifest()
+
+    print("\n>>> Performance Report")
+    publish_traces(run_id)
 
-    print(f"=== CLOUD RUNNER COMPLETE. Uploaded {uploaded_count} files. ===")
+    storage_backend.print_all_metrics()
+    publisher.close()
+    print(f"=== CLOUD RUNNER COMPLETE. Uploaded {uploaded_count} reports, "
+          f"{savings['reports']} unchanged. ===")
 
 if __name__ == "__main__":
     run_scripts()
@@ -0,0 +1,54 @@
+from storage_backend import open_backend
+
+class Publisher:
+    """
+    Publishes local files through one storage backend (one client and pool for the whole run).
+    A file is uploaded once, to its archive path; its aliases (latest/) are server-side copies.
+        publisher.publish([(local_path, archive_path, [latest_path], content_type), ...])
+    """
+
+    def __init__(self, bucket_name, backend=None):
+        self.bucket_name = bucket_name
+        self._backend = backend
+
+    @property
+    def backend(self):
+        # Opened on first use, so nothing connects when there is no bucket to publish to
+        if self._backend is None:
+            self._backend = open_backend(self.bucket_name)
+        return self._backend
+
+    def upload(self, local_path, destination_blob_name, content_type):
+        """Upload one file. Returns True once it is uploaded."""
+        try:
+            self.backend.upload_file(local_path, destination_blob_name, content_type)
+            print(f"[Cloud] Uploaded {local_path} to {self.backend.uri(destination_blob_name)}")
+            return True
+        except Exception as e:
+            print(f"[Error] Failed to upload {local_path}: {e}")
+            return False
+
+    def copy(self, source_blob_name, destination_blob_name):
+        """Server-side copy inside the bucket; nothing goes through this machine."""
+        try:
+            self.backend.copy(source_blob_name, destination_blob_name)
+            print(f"[Cloud] Copied {self.backend.uri(source_blob_name)} to {destination_blob_name}")
+            return True
+        except Exception as e:
+            print(f"[Error] Failed to copy {source_blob_name} to {destination_blob_name}: {e}")
+            return False
+
+    def publish_one(self, task):
+        local_path, blob_name, aliases, content_type = task
+        if not self.upload(local_path, blob_name, content_type):
+            return False
+        copied = [self.copy(blob_name, alias) for alias in aliases]
+        return all(copied)
+
+    def publish(self, tasks):
+        """Publish every task on the backend's pool. Returns one True/False per task, in order."""
+        return self.backend.map(self.publish_one, tasks)
+
+    def close(self):
+        if self._backend is not None:
+            self._backend.close()
@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from datetime import datetime
+from playwright.sync_api import sync_playwright
+import shared_browser
+
+# --- Configuration ---
+# Recorded traffic, one HAR per scraper (e.g. har_fixtures/vietstock_sector_data.har)
+HAR_DIR = os.getenv("HAR_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "har_fixtures"))
+# Reports written during record/replay go here, not into the real output folder
+BENCH_OUTPUT_DIR = os.getenv("BENCH_OUTPUT_DIR", os.path.join(tempfile.gettempdir(), "vnindex_bench"))
+
+def normalize_script(name):
+    return name if name.endswith(".py") else f"{name}.py"
+
+def har_path(script):
+    return os.path.join(HAR_DIR, os.path.splitext(script)[0] + ".har")
+
+def record(browser, script):
+    """Run a scraper live and capture every request/response of its context into a HAR fixture."""
+    module = shared_browser.load_scraper(script)
+    os.makedirs(HAR_DIR, exist_ok=True)
+    context = browser.new_context(record_har_path=har_path(script), **getattr(module, "CONTEXT_OPTIONS", {}))
+    try:
+        return module.run(context)
+    finally:
+        # The HAR file is only written when the context closes
+        context.close()
+
+def replay(browser, script):
+    """Run a scraper fully offline: every request is served from its HAR fixture, anything else is aborted."""
+    path = har_path(script)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No HAR fixture for {script}. Run: python har_bench.py record {script}")
+    module = shared_browser.load_scraper(script)
+    context = browser.new_context(**getattr(module, "CONTEXT_OPTIONS", {}))
+    context.route_from_har(path, not_found="abort")
+    try:
+        return module.run(context)
+    finally:
+        context.close()
+
+class ProcessTreeMemory:
+    """
+    Samples the summed RSS of this process and all its descendants (Playwright driver,
+    Chromium and its renderers) in a background thread and keeps the peak.
+    Linux only (reads /proc); elsewhere peak_mb stays None.
+    """
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def __enter__(self):
+        if os.path.isdir("/proc"):
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    @staticmethod
+    def _tree_rss_kb():
+        children = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat", "r") as f:
+                    # The command name may contain spaces; ppid is the 2nd field after ')'
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                children.setdefault(ppid, []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+
+        total, stack = 0, [os.getpid()]
+        while stack:
+            pid = stack.pop()
+            stack.extend(children.get(pid, []))
+            try:
+                with open(f"/proc/{pid}/status", "r") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            total += int(line.split()[1])
+                            break
+            except OSError:
+                continue
+        return total
+
+    def _sample(self):
+        while not self._stop.is_set():
+            mb = self._tree_rss_kb() / 1024
+            self.peak_mb = mb if self.peak_mb is None else max(self.peak_mb, mb)
+            self._stop.wait(self.interval)
+
+def bench(browser, scripts, iterations):
+    """Replay each scraper `iterations` times. Returns {script: summary}."""
+    results = {}
+    for script in scripts:
+        runs = []
+        for i in range(iterations):
+            print(f"[*] {script} iteration {i + 1}/{iterations}...")
+            tracemalloc.start()
+            with ProcessTreeMemory() as tree:
+                t0 = time.perf_counter()
+                try:
+                    ok = bool(replay(browser, script))
+                except Exception as e:
+                    print(f"[-] Replay failed: {e}")
+                    ok = False
+                wall = time.perf_counter() - t0
+            _, py_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            runs.append({"wall_s": wall, "python_peak_mb": py_peak / 1024 / 1024, "process_tree_peak_mb": tree.peak_mb, "ok": ok})
+
+        walls = sorted(r["wall_s"] for r in runs)
+        tree_peaks = [r["process_tree_peak_mb"] for r in runs if r["process_tree_peak_mb"] is not None]
+        results[script] = {
+            "iterations": iterations,
+            "ok": sum(r["ok"] for r in runs),
+            "wall_mean_s": sum(walls) / len(walls),
+            "wall_median_s": walls[len(walls) // 2],
+            "wall_min_s": walls[0],
+            "wall_max_s": walls[-1],
+            "python_peak_mb": max(r["python_peak_mb"] for r in runs),
+            "process_tree_peak_mb": max(tree_peaks) if tree_peaks else None,
+            "runs": runs
+        }
+    return results
+
+def format_bench(results):
+    lines = [f"{'Scraper':<36} {'OK':>5} {'mean s':>8} {'median s':>9} {'min s':>7} {'max s':>7} {'py MB':>7} {'tree MB':>8}"]
+    for script, r in results.items():
+        tree = f"{r['process_tree_peak_mb']:.0f}" if r["process_tree_peak_mb"] is not None else "n/a"
+        lines.append(f"{script:<36} {r['ok']:>2}/{r['iterations']:<2} {r['wall_mean_s']:>8.2f} {r['wall_median_s']:>9.2f} "
+                     f"{r['wall_min_s']:>7.2f} {r['wall_max_s']:>7.2f} {r['python_peak_mb']:>7.1f} {tree:>8}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Record / replay / benchmark the Playwright scrapers against HAR fixtures.")
+    parser.add_argument("command", choices=["record", "replay", "bench"])
+    parser.add_argument("scrapers", nargs="*", help="Script names (default: all browser scrapers)")
+    parser.add_argument("-n", "--iterations", type=int, default=5, help="Iterations per scraper for bench")
+    args = parser.parse_args()
+
+    # Scrapers read OUTPUT_DIR at import time, so set it before any of them is loaded
+    os.environ["OUTPUT_DIR"] = BENCH_OUTPUT_DIR
+    scripts = [normalize_script(s) for s in args.scrapers] or shared_browser.BROWSER_SCRIPTS
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        try:
+            if args.command == "record":
+                for script in scripts:
+                    print(f"[*] Recording {script} -> {har_path(script)}")
+                    record(browser, script)
+            elif args.command == "replay":
+                for script in scripts:
+                    print(f"[*] Replaying {script} offline...")
+                    path = replay(browser, script)
+                    print(f"[+] {script}: {path}" if path else f"[-] {script}: no report")
+            else:
+                results = bench(browser, scripts, args.iterations)
+                print("\n" + format_bench(results))
+                os.makedirs(BENCH_OUTPUT_DIR, exist_ok=True)
+                out_path = os.path.join(BENCH_OUTPUT_DIR, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+                with open(out_path, "w", encoding="utf-8") as f:
+                    json.dump(results, f, indent=2)
+                print(f"Saved benchmark results to {out_path}")
+        finally:
+            browser.close()
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    main()
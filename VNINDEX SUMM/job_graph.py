@@ -0,0 +1,137 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+# --- Pipeline Declaration ---
+# Report each script publishes to dailyVnindexdata/latest/ (name without the _HHMM suffix)
+REPORT_OUTPUTS = {
+    "vietstock_market_summary.py": ["mktsumary.md"],
+    "vietstock_liquidity_summary.py": ["liquidity_summary.md"],
+    "vietstock_top_influence.py": ["top_influence.md"],
+    "vietstock_foreign_transaction.py": ["foreign_transaction.md"],
+    "vietstock_proprietary_trading.py": ["proprietary_trading.md"],
+    "vietstock_sector_data.py": ["sector_data.md"],
+    "tradingview_vnindex_technicals.py": ["vnindex_technicals.md"],
+    "rss_news_aggregator.py": ["[news summary].md"],
+}
+
+# Reports the morning brief needs before it can be generated
+BRIEF_INPUTS = [
+    "mktsumary.md",
+    "liquidity_summary.md",
+    "top_influence.md",
+    "foreign_transaction.md",
+    "proprietary_trading.md",
+    "sector_data.md",
+    "vnindex_technicals.md",
+]
+
+class JobGraph:
+    """
+    A small dependency graph of async jobs. Each job declares the outputs it publishes
+    and the inputs it needs; a job starts as soon as every input has been published,
+    so independent branches run in parallel.
+    A failed job still settles its outputs, letting downstream stages run on whatever
+    data is available instead of blocking the whole run.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self.producers = {}
+        self.timeline = []
+
+    def add(self, name, run, inputs=(), outputs=()):
+        """`run` is a coroutine function; it should publish its outputs before returning."""
+        self.jobs[name] = {"run": run, "inputs": list(inputs), "outputs": list(outputs)}
+        for output in outputs:
+            self.producers[output] = name
+
+    def validate(self):
+        for name, job in self.jobs.items():
+            missing = [i for i in job["inputs"] if i not in self.producers]
+            if missing:
+                raise ValueError(f"Job {name} needs inputs nobody produces: {missing}")
+
+    async def _run_job(self, name, settled, t0):
+        job = self.jobs[name]
+        await asyncio.gather(*[settled[i].wait() for i in job["inputs"]])
+        entry = {"job": name, "inputs": job["inputs"], "ready": time.perf_counter() - t0}
+        print(f"[DAG] Starting {name}...")
+        try:
+            await job["run"]()
+            entry["status"] = "ok"
+        except Exception as e:
+            entry["status"] = "failed"
+            entry["error"] = str(e)
+            print(f"[DAG] {name} failed: {e}")
+        finally:
+            entry["end"] = time.perf_counter() - t0
+            entry["duration"] = entry["end"] - entry["ready"]
+            self.timeline.append(entry)
+            for output in job["outputs"]:
+                settled[output].set()
+        print(f"[DAG] Finished {name} ({entry['status']}, {entry['duration']:.1f}s)")
+
+    async def run_async(self):
+        self.validate()
+        self.timeline = []
+        settled = {output: asyncio.Event() for output in self.producers}
+        t0 = time.perf_counter()
+        await asyncio.gather(*[self._run_job(name, settled, t0) for name in self.jobs])
+        self.timeline.sort(key=lambda e: e["ready"])
+        return self.timeline
+
+    def run(self):
+        return asyncio.run(self.run_async())
+
+    def critical_path(self):
+        """Walk back from the last job to finish, always through the input that settled last."""
+        by_name = {e["job"]: e for e in self.timeline}
+        if not by_name:
+            return []
+        current = max(self.timeline, key=lambda e: e["end"])
+        path = [current["job"]]
+        while current["inputs"]:
+            upstream = [by_name[self.producers[i]] for i in current["inputs"]]
+            current = max(upstream, key=lambda e: e["end"])
+            path.append(current["job"])
+        return list(reversed(path))
+
+    def write_timeline(self, output_dir):
+        """Print the timeline and save it as run_timeline_HHMM.json. Returns the saved path."""
+        path_jobs = self.critical_path()
+        print("\n[DAG] Timeline (seconds from start):")
+        for e in self.timeline:
+            marker = "*" if e["job"] in path_jobs else " "
+            print(f"  {marker} {e['ready']:7.1f} -> {e['end']:7.1f}  {e['job']} ({e['status']})")
+        print(f"[DAG] Critical path: {' -> '.join(path_jobs)}")
+
+        now = datetime.now(timezone(timedelta(hours=7)))
+        full_dir = os.path.join(output_dir, now.strftime("%Y%m%d"))
+        os.makedirs(full_dir, exist_ok=True)
+        filepath = os.path.join(full_dir, f"run_timeline_{now.strftime('%H%M')}.json")
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump({
+                "generated_at": now.isoformat(),
+                "total_seconds": max((e["end"] for e in self.timeline), default=0),
+                "critical_path": path_jobs,
+                "jobs": self.timeline
+            }, f, ensure_ascii=False, indent=2)
+        print(f"[DAG] Saved timeline to {filepath}")
+        return filepath
+
+def build_pipeline(scripts, run_script, brief_script=None):
+    """
+    Build the daily graph: one job per script (publishing its REPORT_OUTPUTS) and,
+    optionally, the brief generator gated on the BRIEF_INPUTS that this run produces.
+    `run_script(script)` is a coroutine function that runs and publishes one script.
+    """
+    graph = JobGraph()
+    for script in scripts:
+        graph.add(script, lambda script=script: run_script(script), outputs=REPORT_OUTPUTS.get(script, []))
+    if brief_script:
+        inputs = [i for i in BRIEF_INPUTS if i in graph.producers]
+        graph.add(brief_script, lambda: run_script(brief_script), inputs=inputs)
+    return graph
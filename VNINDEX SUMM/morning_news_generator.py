@@ -7,9 +7,15 @@ import google.generativeai as genai
 from dotenv import load_dotenv
 import json
 import re
-import wave
-import io
 import google.auth
+import time
+import hashlib
+from storage_backend import open_backend
+from brief_context import compact_sources, join_sources
+from brief_summarizer import PRESUMMARIZE, FACT_MODEL, FACT_SHEET_WORDS, FACT_PROMPT, make_model, summarize_sources
+from brief_tts import TTS_MODE, TurnSynthesizer, make_tts, write_wav
+from brief_stream import DialogueStreamParser
+from tracing import span
 
 # Fix encoding
 sys.stdout.reconfigure(encoding='utf-8')
@@ -22,6 +28,21 @@ GEMINI_KEY = os.getenv("GEMINI_API_KEY", "AIzaSyDonSs_FcxC9pfyXwW6NiSGxLgbVZqg8_
 BUCKET_NAME = "wealth-up-storage"
 GCS_PREFIX = "dailyVnindexdata/latest/"
 LOCAL_MOCK_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "gcs_mock"))
+# Each report is cut to this many bytes (UTF-8) before it goes into the prompt; 0 = no limit
+MAX_FILE_BYTES = int(os.getenv("BRIEF_MAX_FILE_BYTES", "60000"))
+SCRIPT_MODEL = "gemini-2.5-pro"
+# BRIEF_STREAM=1 streams the script and, with BRIEF_TTS_MODE=turns, sends each finished turn
+# to TTS while the rest of the script is still being written
+STREAM_SCRIPT = os.getenv("BRIEF_STREAM", "0") == "1"
+# Presenter voices (Speaker1 = Mai, Speaker2 = Hùng) and TTS settings
+TTS_MODEL = "gemini-2.5-pro-tts"
+TTS_LANGUAGE = "vi-VN"
+TTS_SAMPLE_RATE = 24000
+SPEAKER_VOICES = {"Speaker1": "Aoede", "Speaker2": "Charon"}
+# The script and audio of the last brief are reused while its inputs (data context, prompt, models,
+# voices) hash the same; BRIEF_FORCE_REFRESH=1 or --force regenerates them anyway
+BRIEF_CACHE_BLOB = "dailyVnindexdata/brief_cache.json"
+FORCE_REFRESH = os.getenv("BRIEF_FORCE_REFRESH", "0") == "1" or "--force" in sys.argv
 
 # Determine Environment
 # 1. Default to False (Production-first safety)
@@ -40,7 +61,6 @@ print(f"Config: BUCKET={BUCKET_NAME}, LOCAL_MODE={IS_LOCAL}")
 # Try importing library for Cloud Storage and TTS
 HAS_GCS_LIB = False
 try:
-    from google.cloud import storage
     from google.cloud import texttospeech
     print("✅ Google Cloud Libraries loaded.")
     HAS_GCS_LIB = True
@@ -58,83 +78,192 @@ def run_gcloud_cmd(args):
         print(f"Error running gcloud: {e}")
         return None
 
-def list_files_gcs(bucket_name, prefix):
+def storage():
+    """GCS, or LOCAL_MOCK_DIR in local mode; one shared client (see storage_backend.py)."""
+    return open_backend(BUCKET_NAME, local_dir=LOCAL_MOCK_DIR if IS_LOCAL else None)
+
+def list_report_files():
+    """Report names under latest/ (GCS_PREFIX in the bucket, latest/ in the local mock)."""
+    prefix = "latest/" if IS_LOCAL else GCS_PREFIX
     try:
-        from google.cloud import storage
-        print(f"DEBUG: GCS Connect - Bucket='{bucket_name}' (repr={repr(bucket_name)})")
-        client = storage.Client()
-        print(f"DEBUG: GCS Client Project: {client.project}")
-        bucket = client.bucket(bucket_name)
-        # cleanup prefix
-        prefix_clean = prefix.strip("/")
-        blobs = bucket.list_blobs(prefix=prefix_clean) 
-        
-        files = []
-        for blob in blobs:
-            if blob.name.endswith(".md"):
-                files.append(blob.name) # blob.name is relative to bucket
-        print(f"   [Debugging] Found {len(files)} files in GCS.")
+        files = storage().list(prefix, ".md")
+        print(f"   [Debugging] Found {len(files)} files in {storage().uri(prefix)}.")
         return files
     except Exception as e:
-        print(f"⚠️ GCS List Error: {e}")
+        print(f"⚠️ Storage List Error: {e}")
         return []
 
-def read_file_gcs(bucket_name, blob_name):
+def read_report_file(name):
     try:
-        from google.cloud import storage
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        return blob.download_as_text(encoding="utf-8")
+        return storage().read_text(name, default="")
     except Exception as e:
-        print(f"⚠️ GCS Read Error: {e}")
+        print(f"⚠️ Storage Read Error ({name}): {e}")
         return ""
 
-def list_files_local(mock_dir, prefix):
-    target_dir = os.path.join(mock_dir, prefix.strip("/"))
-    if not os.path.exists(target_dir): return []
-    files = []
-    for f in os.listdir(target_dir):
-        if f.endswith(".md"): files.append(os.path.join(target_dir, f))
-    return files
+def truncate_bytes(content, max_bytes):
+    """Cut `content` to at most `max_bytes` UTF-8 bytes, on a character boundary, and say so."""
+    data = content.encode("utf-8")
+    if not max_bytes or len(data) <= max_bytes:
+        return content
+    kept = data[:max_bytes].decode("utf-8", errors="ignore")
+    return kept + f"\n\n[... truncated {len(data) - max_bytes} bytes]"
 
-def read_file_local(path):
+def load_reports(max_bytes=MAX_FILE_BYTES):
+    """
+    Every report under latest/, downloaded concurrently through the shared storage client.
+    Returns [(name, content)] in name order, whatever order the downloads finish in.
+    """
+    t0 = time.perf_counter()
+    names = list_report_files()
+    contents = storage().map(read_report_file, names)
+    reports = []
+    total_bytes = 0
+    for name, content in zip(names, contents):
+        total_bytes += len(content.encode("utf-8"))
+        trimmed = truncate_bytes(content, max_bytes)
+        if trimmed is not content:
+            print(f"   [!] {name} cut to {max_bytes} bytes")
+        reports.append((name, trimmed))
+    print(f"   [+] Loaded {len(reports)} reports ({total_bytes / 1024:.1f} KB) in {time.perf_counter() - t0:.2f}s")
+    return reports
+
+def brief_cache_key(data_context, prompt_template):
+    """Hash of everything the script and audio are made from."""
+    inputs = {
+        "data_context": data_context,
+        "prompt": prompt_template,
+        "script_model": SCRIPT_MODEL,
+        "fact_sheets": [FACT_MODEL, FACT_SHEET_WORDS, FACT_PROMPT] if PRESUMMARIZE else None,
+        "voice": [TTS_MODE, TTS_MODEL, TTS_LANGUAGE, TTS_SAMPLE_RATE, SPEAKER_VOICES],
+    }
+    return hashlib.sha256(json.dumps(inputs, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+def cached_brief(key):
+    """The cache entry for `key` while its audio is still stored, else None (the script is in the entry)."""
+    if FORCE_REFRESH:
+        print("   [*] Force refresh: brief cache ignored")
+        return None
+    try:
+        entry = json.loads(storage().read_text(BRIEF_CACHE_BLOB, default="{}"))
+        if entry.get("key") == key and entry.get("script_data") and storage().exists(entry["audio"]):
+            return entry
+    except Exception as e:
+        print(f"⚠️ Brief cache read error: {e}")
+    return None
+
+def reuse_cached_brief(entry, local_json_path, today_path):
+    """Write the cached script to `local_json_path` and put script and audio into today's folder."""
+    with open(local_json_path, "w", encoding="utf-8") as f:
+        json.dump(entry["script_data"], f, ensure_ascii=False, indent=2)
+    script_blob = f"{today_path}/{os.path.basename(local_json_path)}"
+    storage().upload_file(local_json_path, script_blob, content_type="application/json")
+    print(f"✅ Reused the cached script as {script_blob}")
+    target = f"{today_path}/{os.path.basename(entry['audio'])}"
+    if target != entry["audio"]:
+        storage().copy(entry["audio"], target)
+        print(f"✅ Reused {entry['audio']} as {target}")
+
+def save_brief_cache(key, script_data, audio_blob):
+    """
+    Record the brief made from `key`. The script itself goes into the entry, so the brief can be
+    reused even when the script JSON was never uploaded (local mode, or a failed upload).
+    """
+    entry = {"key": key, "script_data": script_data, "audio": audio_blob,
+             "created_at": datetime.datetime.now().isoformat(timespec="seconds")}
     try:
-        with open(path, "r", encoding="utf-8") as f: return f.read()
-    except Exception: return ""
+        storage().write_text(BRIEF_CACHE_BLOB, json.dumps(entry, ensure_ascii=False, indent=2), content_type="application/json")
+    except Exception as e:
+        print(f"⚠️ Brief cache write error: {e}")
+
+def parse_script(raw_content):
+    """The whole script response (optionally in a ```json fence) as {"dialogue": [...]}."""
+    clean_content = raw_content.strip()
+    if clean_content.startswith("```json"): clean_content = clean_content.replace("```json", "", 1)
+    if clean_content.startswith("```"): clean_content = clean_content.replace("```", "", 1)
+    if clean_content.endswith("```"): clean_content = clean_content[:-3]
+    return json.loads(clean_content.strip())
+
+def tts_turns(dialogue):
+    """Dialogue turns as [(speaker alias, text)] for TTS: Mai -> Speaker1, Hùng -> Speaker2, stage directions removed."""
+    turns = []
+    for turn in dialogue:
+        speaker_name = turn.get("speaker", "Mai")
+        text = turn.get("text", "")
+        if not text or not text.strip(): continue
+
+        # Map local names to generic Speaker aliases
+        alias = "Speaker2" if ("Hùng" in speaker_name or "Nam" in speaker_name) else "Speaker1"
+
+        # Cleanup text for TTS
+        text = text.replace("[pause]", "")
+        text = re.sub(r'\[(?!break)[^\]]+\]', '', text)
+        turns.append((alias, text))
+    return turns
+
+def new_synthesizer():
+    return TurnSynthesizer(make_tts(TTS_LANGUAGE, TTS_MODEL, SPEAKER_VOICES, TTS_SAMPLE_RATE), TTS_SAMPLE_RATE)
+
+def stream_script(model, prompt, synthesizer=None):
+    """
+    BRIEF_STREAM=1: read the script as it streams in, handing each completed turn to
+    `synthesizer` (per-turn TTS) straight away. Returns the script as {"dialogue": [...]}.
+    """
+    t0 = time.perf_counter()
+    parser = DialogueStreamParser()
+    for piece in model.generate_stream(prompt):
+        completed = parser.feed(piece)
+        if completed and len(parser.turns) == len(completed):
+            print(f"   [+] First turn after {time.perf_counter() - t0:.2f}s")
+        if synthesizer and completed:
+            synthesizer.add(tts_turns(completed))
+    script_data = parser.result()
+    if script_data is None:
+        # Not in the expected shape while streaming: read the whole response as the non-streaming path does
+        script_data = parse_script(parser.text)
+        if synthesizer:
+            synthesizer.add(tts_turns(script_data.get("dialogue", [])))
+    return script_data
+
+def generate_audio_by_turns(synthesizer, today_path):
+    """
+    BRIEF_TTS_MODE=turns: wait for the turns queued on `synthesizer` (standard TTS API, concurrent),
+    stitch the PCM into one WAV here and upload it as soon as it is assembled. Returns the audio blob name.
+    """
+    pcm = synthesizer.finish()
+    output_filename = f"morning_news_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.wav"
+    local_path = os.path.join("/tmp" if not IS_LOCAL else os.path.dirname(__file__), output_filename)
+    write_wav(pcm, local_path, TTS_SAMPLE_RATE)
+    audio_blob = f"{today_path}/{output_filename}"
+    storage().upload_file(local_path, audio_blob, content_type="audio/wav")
+    print(f"✅ Audio uploaded: {storage().uri(audio_blob)}")
+    return audio_blob
 
 def generate_morning_news():
-    print("=== Morning News Generator (Long Audio TTS) ===")
+    """Generate (or reuse) today's script and audio. Returns True once the brief's audio exists."""
+    tts_label = "per-turn TTS" if TTS_MODE == "turns" else "Long Audio TTS"
+    print(f"=== Morning News Generator ({tts_label}, BRIEF_TTS_MODE={TTS_MODE}) ===")
     print(f"Config: BUCKET={BUCKET_NAME}, LOCAL_MODE={IS_LOCAL}")
 
 
     genai.configure(api_key=GEMINI_KEY)
 
-    # Use Gemini 2.5 Pro for script generation
-    model = genai.GenerativeModel('gemini-2.5-pro') 
+    # Use Gemini 2.5 Pro for script generation (BRIEF_MODEL_BACKEND=stub: offline stand-in)
+    model = make_model(SCRIPT_MODEL)
 
     # --- 1. Load Data ---
-    all_content = []
     if IS_LOCAL:
         print(f"Source: Local Mock ({LOCAL_MOCK_DIR}/latest)")
-        files = list_files_local(LOCAL_MOCK_DIR, "latest")
-        for f in files:
-            print(f"   [+] Reading {os.path.basename(f)}...")
-            content = read_file_local(f)
-            all_content.append(f"--- FILE: {os.path.basename(f)} ---\n{content}\n")
     else:
         print(f"Source: GCS ({BUCKET_NAME}/{GCS_PREFIX})")
-        files = list_files_gcs(BUCKET_NAME, GCS_PREFIX)
-        for fname in files:
-            print(f"   [Cloud] Reading {fname}...")
-            content = read_file_gcs(BUCKET_NAME, fname)
-            all_content.append(f"--- FILE: {fname} ---\n{content}\n")
+    reports = load_reports()
+    storage().print_metrics()
 
-    if not all_content:
+    if not reports:
         print(f"Warning: No data found in {GCS_PREFIX if not IS_LOCAL else LOCAL_MOCK_DIR}")
-        return 
+        return False
     
-    full_data_context = "\n".join(all_content)
+    # Compact form (tables as CSV lines, articles cut), held to a token budget per source
+    sources = compact_sources(reports)
 
     # --- 2. Prompt for JSON (ENFORCING LONG SCRIPT) ---
     prompt_template = """
@@ -179,31 +308,41 @@ def generate_morning_news():
 ```
     """
 
+    today_path = datetime.datetime.now().strftime("dailyVnindexdata/%Y/%m/%d")
+    script_filename = "morningnewscript.json"
+    local_json_path = "/tmp/" + script_filename if not IS_LOCAL else os.path.join(os.path.dirname(__file__), script_filename)
+
+    # Same inputs as the last brief (weekend, holiday, re-triggered job): reuse its script and audio
+    cache_key = brief_cache_key(join_sources(sources), prompt_template)
+    cached = cached_brief(cache_key)
+    if cached:
+        print(f"✅ Inputs unchanged since {cached['created_at']}: reusing the cached script and audio")
+        reuse_cached_brief(cached, local_json_path, today_path)
+        return True
+
+    # Map: one fact sheet per report from the fast model, in parallel; the Pro call then reads only those
+    if PRESUMMARIZE:
+        sources = summarize_sources(sources)
+    full_data_context = join_sources(sources)
+
     prompt = prompt_template.replace("{full_data_context}", full_data_context)
     
     print("Generating script content with Gemini...")
+    synthesizer = None
     try:
-        response = model.generate_content(prompt)
-        raw_content = response.text
-        
-        # Clean JSON
-        clean_content = raw_content.strip()
-        if clean_content.startswith("```json"): clean_content = clean_content.replace("```json", "", 1)
-        if clean_content.startswith("```"): clean_content = clean_content.replace("```", "", 1)
-        if clean_content.endswith("```"): clean_content = clean_content[:-3]
-        clean_content = clean_content.strip()
-
-        script_data = json.loads(clean_content)
+        t0 = time.perf_counter()
+        # Streaming + per-turn TTS: audio for the first turns is made while the model writes the rest
+        synthesizer = new_synthesizer() if STREAM_SCRIPT and TTS_MODE == "turns" else None
+        with span("morning_brief", "script", model=model.name, stream=STREAM_SCRIPT):
+            if STREAM_SCRIPT:
+                script_data = stream_script(model, prompt, synthesizer)
+            else:
+                script_data = parse_script(model.generate(prompt))
+        print(f"   [+] Script from {model.name} in {time.perf_counter() - t0:.2f}s")
+
         print(f"✅ JSON Script parsed. Turns: {len(script_data.get('dialogue', []))}")
 
         # Save JSON/MD
-        today = datetime.datetime.now()
-        year_str = today.strftime("%Y")
-        month_str = today.strftime("%m")
-        day_str = today.strftime("%d")
-
-        script_filename = "morningnewscript.json"
-        local_json_path = "/tmp/" + script_filename if not IS_LOCAL else os.path.join(os.path.dirname(__file__), script_filename)
         with open(local_json_path, "w", encoding="utf-8") as f:
             json.dump(script_data, f, ensure_ascii=False, indent=2)
             
@@ -212,15 +351,32 @@ def generate_morning_news():
         # --- IMMEDIATE UPLOAD JSON (Safety) ---
         if HAS_GCS_LIB and BUCKET_NAME and not IS_LOCAL:
              try:
-                 storage_client = storage.Client()
-                 bucket = storage_client.bucket(BUCKET_NAME)
-                 gcs_json_path = f"dailyVnindexdata/{year_str}/{month_str}/{day_str}/{script_filename}"
-                 blob_json = bucket.blob(gcs_json_path)
-                 blob_json.upload_from_filename(local_json_path, content_type='application/json')
+                 gcs_json_path = f"{today_path}/{script_filename}"
+                 storage().upload_file(local_json_path, gcs_json_path, content_type='application/json')
                  print(f"✅ Uploaded JSON immediately: {gcs_json_path}")
              except Exception as e:
                  print(f"⚠️ JSON Upload Error: {e}")
 
+        # --- 3a. Per-turn TTS, stitched locally ---
+        if TTS_MODE == "turns":
+            turns = tts_turns(script_data.get("dialogue", []))
+            if not turns:
+                print("❌ ERROR: No valid turns found for TTS.")
+                return False
+            if synthesizer is None:
+                synthesizer = new_synthesizer()
+                synthesizer.add(turns)
+            print(f">>> Synthesizing {len(turns)} turns concurrently...")
+            try:
+                audio_blob = generate_audio_by_turns(synthesizer, today_path)
+            except Exception as tts_error:
+                print(f"❌ CRITICAL ERROR during per-turn TTS generation: {tts_error}")
+                import traceback
+                traceback.print_exc()
+                return False
+            save_brief_cache(cache_key, script_data, audio_blob)
+            return True
+
         # --- 3. Long Audio TTS Generation ---
         print(f">>> Starting Long Audio TTS for {len(script_data.get('dialogue', []))} turns...")
         
@@ -228,7 +384,7 @@ def generate_morning_news():
             # Check availability of Long Audio Client
             if not hasattr(texttospeech, "TextToSpeechLongAudioSynthesizeClient"):
                  print("❌ TextToSpeechLongAudioSynthesizeClient not found in this version of google-cloud-texttospeech. Please upgrade.")
-                 return
+                 return False
 
             client = texttospeech.TextToSpeechLongAudioSynthesizeClient()
             print("✅ Long Audio TTS Client initialized")
@@ -247,27 +403,11 @@ def generate_morning_news():
 
             from google.cloud.texttospeech_v1.types import MultiSpeakerMarkup, MultiSpeakerVoiceConfig, MultispeakerPrebuiltVoice
             
-            turns = []
-            for turn in script_data.get("dialogue", []):
-                speaker_name = turn.get("speaker", "Mai")
-                text = turn.get("text", "")
-                if not text or not text.strip(): continue
-
-                # Map local names to generic Speaker aliases
-                alias = "Speaker2" if ("Hùng" in speaker_name or "Nam" in speaker_name) else "Speaker1"
-                
-                # Cleanup text for TTS
-                text = text.replace("[pause]", "")
-                text = re.sub(r'\[(?!break)[^\]]+\]', '', text)
-                
-                turns.append(MultiSpeakerMarkup.Turn(
-                    text=text,
-                    speaker=alias
-                ))
+            turns = [MultiSpeakerMarkup.Turn(text=text, speaker=alias) for alias, text in tts_turns(script_data.get("dialogue", []))]
 
             if not turns:
                 print("❌ ERROR: No valid turns found for TTS.")
-                return
+                return False
 
             print(f">>> Sending {len(turns)} turns to Long Audio API (Gemini 2.5 Pro TTS)...")
             print(f"    Parent: {parent}")
@@ -275,21 +415,21 @@ def generate_morning_news():
             # Configure Speaker Mapping
             ms_config = MultiSpeakerVoiceConfig(
                 speaker_voice_configs=[
-                    MultispeakerPrebuiltVoice(speaker_alias="Speaker1", speaker_id="Aoede"),  # Mai
-                    MultispeakerPrebuiltVoice(speaker_alias="Speaker2", speaker_id="Charon")  # Hùng
+                    MultispeakerPrebuiltVoice(speaker_alias=alias, speaker_id=voice_id)
+                    for alias, voice_id in SPEAKER_VOICES.items()
                 ]
             )
 
             # Configure Voice Params
             voice = texttospeech.VoiceSelectionParams(
-                language_code="vi-VN", 
-                model_name="gemini-2.5-pro-tts",
+                language_code=TTS_LANGUAGE,
+                model_name=TTS_MODEL,
                 multi_speaker_voice_config=ms_config
             )
 
             audio_config = texttospeech.AudioConfig(
                 audio_encoding=texttospeech.AudioEncoding.LINEAR16,
-                sample_rate_hertz=24000 
+                sample_rate_hertz=TTS_SAMPLE_RATE
             )
 
             # Input with Markup
@@ -308,7 +448,6 @@ def generate_morning_news():
             # Let's write to date folder AND latest if possible, but Long Audio outputs 1 file.
             # We'll write to date folder for persistence.
             
-            today_path = datetime.datetime.now().strftime("dailyVnindexdata/%Y/%m/%d")
             gcs_uri = f"gs://{BUCKET_NAME}/{today_path}/{output_filename}"
             
             print(f"   Target GCS URI: {gcs_uri}")
@@ -328,17 +467,25 @@ def generate_morning_news():
             result = operation.result(timeout=600) # Wait up to 10 minutes
             
             print(f"✅ Long Audio TTS success! Output saved to: {gcs_uri}")
+            save_brief_cache(cache_key, script_data, f"{today_path}/{output_filename}")
+            return True
             
         except Exception as tts_error:
             print(f"❌ CRITICAL ERROR during Long Audio TTS generation: {tts_error}")
             import traceback
             traceback.print_exc()
-            return
+            return False
 
     except Exception as e:
         print(f"Critical Error: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        # A stream or parse error mid-dialogue must not leave TTS chunks running
+        if synthesizer:
+            synthesizer.close()
+    return False
 
 if __name__ == "__main__":
-    generate_morning_news()
+    # Non-zero on failure, so cloud_runner does not record these inputs as briefed
+    sys.exit(0 if generate_morning_news() else 1)
@@ -0,0 +1,46 @@
+import os
+import time
+from urllib.parse import urlsplit, urlunsplit
+from tracing import span
+
+# --- Configuration ---
+# LEGACY_DOUBLE_LOAD=1 restores the old goto-then-reload navigation
+LEGACY_DOUBLE_LOAD = os.getenv("LEGACY_DOUBLE_LOAD", "0") == "1"
+
+def disable_cache(page):
+    """
+    Turn off Chromium's HTTP cache for this page (same as DevTools "Disable cache").
+    Chromium then sends no-cache request headers itself, which, unlike headers set
+    from the page, do not trigger CORS preflights on cross-origin XHRs.
+    Returns False when CDP is unavailable (non-Chromium browsers).
+    """
+    try:
+        session = page.context.new_cdp_session(page)
+        session.send("Network.setCacheDisabled", {"cacheDisabled": True})
+        return True
+    except Exception as e:
+        print(f"Could not disable cache via CDP ({e}), using a cache-busting URL instead.")
+        return False
+
+def cache_busted(url):
+    """Add a _ts query parameter (before any #fragment) so no cache can answer the request."""
+    parts = urlsplit(url)
+    query = f"{parts.query}&_ts={int(time.time() * 1000)}" if parts.query else f"_ts={int(time.time() * 1000)}"
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, query, parts.fragment))
+
+def fresh_goto(page, scraper, url, wait_until="domcontentloaded", timeout=60000):
+    """
+    Load `url` once with guaranteed non-cached data, replacing the old
+    "goto, then reload to ensure fresh data" pattern that downloaded and rendered every page twice.
+    """
+    if LEGACY_DOUBLE_LOAD:
+        with span(scraper, "navigate", url=url):
+            page.goto(url, timeout=timeout, wait_until=wait_until)
+        print("Reloading page to ensure fresh data...")
+        with span(scraper, "reload"):
+            page.reload(wait_until=wait_until)
+        return
+
+    target = url if disable_cache(page) else cache_busted(url)
+    with span(scraper, "navigate", url=url, fresh=True):
+        page.goto(target, timeout=timeout, wait_until=wait_until)
@@ -0,0 +1,40 @@
+# Table reads in a single browser round trip, instead of one locator call per row or cell.
+
+ROWS_JS = """(rows) => rows.map(tr => ({
+    text: tr.innerText,
+    cells: Array.from(tr.querySelectorAll('th, td')).map(c => c.textContent.trim()),
+    header: !tr.querySelector('td')
+}))"""
+
+TABLE_JS = """(table) => ({
+    headers: Array.from(table.querySelectorAll('thead th'))
+        .map(th => th.textContent.trim().replace(/\\n/g, ' '))
+        .filter(h => h.trim()),
+    rows: Array.from(table.querySelectorAll('tbody tr'))
+        .map(tr => Array.from(tr.querySelectorAll('td')).map(td => td.textContent.trim()))
+        .filter(cells => cells.length)
+})"""
+
+def read_rows(page, row_selector, limit=None):
+    """
+    Every row matching `row_selector`, read with one evaluate_all call:
+        [{"text": <row innerText>, "cells": [<cell text>, ...], "header": <True for th-only rows>}]
+    """
+    rows = page.locator(row_selector).evaluate_all(ROWS_JS)
+    return rows[:limit] if limit else rows
+
+def read_table(container):
+    """Header texts (thead th) and body cell texts (tbody tr) of the table under a locator: {"headers", "rows"}."""
+    return container.evaluate(TABLE_JS)
+
+def split_header(rows):
+    """
+    read_rows() output as (column names, body cell rows). The first th-only row names the
+    columns; without one they are numbered. Rows with no cells are dropped.
+    """
+    header = next((r for r in rows if r["header"] and r["cells"]), None)
+    body = [r["cells"] for r in rows if not r["header"] and r["cells"]]
+    if header:
+        return header["cells"], body
+    width = max((len(cells) for cells in body), default=0)
+    return [f"Col {i + 1}" for i in range(width)], body
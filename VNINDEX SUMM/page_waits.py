@@ -0,0 +1,217 @@
+import os
+import re
+import time
+from contextlib import contextmanager
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+from tracing import emit_span
+
+# Readiness waits that replace the scrapers' fixed time.sleep() delays.
+# Each wait resolves as soon as the data is actually there; if that never happens
+# it gives up after the old fixed delay (or `timeout`) and the scraper carries on,
+# so a run is never slower than with the fixed sleeps.
+
+POLL_MS = 100
+# Pages one scraper drives at once against its host: the runners' per-host limit
+# (shared_browser.PER_HOST_LIMIT), so interleaving pages inside one scraper slot does not bypass it
+MAX_PAGES = max(1, int(os.getenv("SCRAPER_PER_HOST_LIMIT", "2")))
+
+def _report(scraper, reason, elapsed, fixed_delay, ready):
+    saved = fixed_delay - elapsed
+    state = "ready" if ready else "timed out"
+    print(f"[wait] {reason}: {state} after {elapsed:.2f}s (fixed delay was {fixed_delay}s, saved {saved:.2f}s)")
+    emit_span(scraper, "wait", elapsed, reason=reason, fixed_s=fixed_delay, saved_s=round(saved, 3), ready=ready)
+
+def wait_for_condition(page, scraper, js, fixed_delay, reason, arg=None, timeout=None):
+    """Poll a JS predicate in the page until it is truthy. Returns True if it became ready."""
+    timeout = fixed_delay if timeout is None else timeout
+    t0 = time.perf_counter()
+    try:
+        page.wait_for_function(js, arg=arg, timeout=timeout * 1000, polling=POLL_MS)
+        ready = True
+    except PlaywrightTimeoutError:
+        ready = False
+    _report(scraper, reason, time.perf_counter() - t0, fixed_delay, ready)
+    return ready
+
+# --- Signatures: snapshot state before an action, then wait for it to change ---
+
+TABLE_SIGNATURE_JS = """(sel) => {
+    const rows = document.querySelectorAll(sel);
+    if (!rows.length) return '0';
+    return rows.length + '|' + rows[0].textContent.trim() + '|' + rows[rows.length - 1].textContent.trim();
+}"""
+
+CHART_SIGNATURE_JS = """(container) => {
+    if (!window.Highcharts) return '';
+    return Highcharts.charts
+        .filter(c => c && (!container || (c.renderTo && c.renderTo.closest(container))))
+        .map(c => c.series.map(s => {
+            const d = s.options.data || [];
+            return d.length + ':' + JSON.stringify(d[d.length - 1] || null);
+        }).join(','))
+        .join(';');
+}"""
+
+def table_signature(page, row_selector):
+    return page.evaluate(TABLE_SIGNATURE_JS, row_selector)
+
+def chart_signature(page, container=None):
+    return page.evaluate(CHART_SIGNATURE_JS, container)
+
+def wait_for_table_stable(page, scraper, row_selector, fixed_delay, reason, previous=None, stable_ms=300, timeout=None):
+    """
+    Wait until the rows matching `row_selector` exist and have stopped changing for `stable_ms`.
+    Pass `previous` (from table_signature taken before a click) to also require that the
+    table differs from what was shown before.
+    """
+    js = """({sel, previous, stableMs}) => {
+        const signatureOf = """ + TABLE_SIGNATURE_JS + """;
+        const signature = signatureOf(sel);
+        const state = window.__tableWait || (window.__tableWait = {});
+        const now = performance.now();
+        const seen = state[sel];
+        if (!seen || seen.signature !== signature) {
+            state[sel] = {signature, since: now};
+            return false;
+        }
+        return signature !== '0' && signature !== previous && now - seen.since >= stableMs;
+    }"""
+    page.evaluate("(sel) => { if (window.__tableWait) delete window.__tableWait[sel]; }", row_selector)
+    arg = {"sel": row_selector, "previous": previous, "stableMs": stable_ms}
+    return wait_for_condition(page, scraper, js, fixed_delay, reason, arg=arg, timeout=timeout)
+
+def wait_for_highcharts(page, scraper, fixed_delay, reason, min_charts=1, container=None, previous=None, timeout=None):
+    """
+    Wait until at least `min_charts` Highcharts charts (optionally inside `container`)
+    have populated series. Pass `previous` (from chart_signature) to wait for a redraw.
+    """
+    js = """({minCharts, container, previous}) => {
+        const signatureOf = """ + CHART_SIGNATURE_JS + """;
+        if (!window.Highcharts) return false;
+        const charts = Highcharts.charts.filter(c => c && (!container || (c.renderTo && c.renderTo.closest(container))));
+        const populated = charts.filter(c => c.series.length && c.series.some(s => (s.options.data || []).length));
+        if (populated.length < minCharts) return false;
+        return previous === null || signatureOf(container) !== previous;
+    }"""
+    arg = {"minCharts": min_charts, "container": container, "previous": previous}
+    return wait_for_condition(page, scraper, js, fixed_delay, reason, arg=arg, timeout=timeout)
+
+def wait_for_visible(page, scraper, selector, fixed_delay, reason, timeout=None):
+    """Wait until any element matching `selector` is rendered (e.g. an ad popup that may never come)."""
+    js = "(sel) => Array.from(document.querySelectorAll(sel)).some(el => el.offsetParent !== null)"
+    return wait_for_condition(page, scraper, js, fixed_delay, reason, arg=selector, timeout=timeout)
+
+class NetworkWatch:
+    """
+    Track matching XHR/fetch requests from construction on. wait() blocks until none has
+    been in flight for `quiet_ms` (or `timeout`), then stops listening; stop() only stops.
+    Split out of network_quiet() so a run_interleaved() task can fire its action and
+    yield watch.wait instead of blocking on it.
+    """
+
+    def __init__(self, page, scraper, fixed_delay, reason, url_pattern=None, quiet_ms=500, timeout=None):
+        self.page = page
+        self.scraper = scraper
+        self.fixed_delay = fixed_delay
+        self.reason = reason
+        self.quiet_ms = quiet_ms
+        self.timeout = fixed_delay if timeout is None else timeout
+        self.pattern = re.compile(url_pattern) if url_pattern else None
+        self.inflight = set()
+        self.seen = 0
+        self.last_change = time.perf_counter()
+        self.listening = True
+        page.on("request", self._on_request)
+        page.on("requestfinished", self._on_done)
+        page.on("requestfailed", self._on_done)
+
+    def _matches(self, request):
+        if request.resource_type not in ("xhr", "fetch"):
+            return False
+        return self.pattern is None or bool(self.pattern.search(request.url))
+
+    def _on_request(self, request):
+        if self._matches(request):
+            self.inflight.add(request)
+            self.seen += 1
+            self.last_change = time.perf_counter()
+
+    def _on_done(self, request):
+        if request in self.inflight:
+            self.inflight.discard(request)
+            self.last_change = time.perf_counter()
+
+    def wait(self):
+        """Wait for the network to go quiet. Returns True if it did before the timeout."""
+        try:
+            t0 = time.perf_counter()
+            if not self.seen:
+                self.last_change = t0
+            ready = False
+            while time.perf_counter() - t0 < self.timeout:
+                now = time.perf_counter()
+                quiet = not self.inflight and (now - self.last_change) * 1000 >= self.quiet_ms
+                # With nothing seen yet, give the request a moment to start before calling it quiet
+                if quiet and (self.seen or (now - t0) * 1000 >= 2 * self.quiet_ms):
+                    ready = True
+                    break
+                # wait_for_timeout (not time.sleep) so Playwright keeps dispatching request events
+                self.page.wait_for_timeout(50)
+            _report(self.scraper, self.reason, time.perf_counter() - t0, self.fixed_delay, ready)
+            return ready
+        finally:
+            self.stop()
+
+    def stop(self):
+        if not self.listening:
+            return
+        self.listening = False
+        self.page.remove_listener("request", self._on_request)
+        self.page.remove_listener("requestfinished", self._on_done)
+        self.page.remove_listener("requestfailed", self._on_done)
+
+@contextmanager
+def network_quiet(page, scraper, fixed_delay, reason, url_pattern=None, quiet_ms=500, timeout=None):
+    """
+    Wrap the action that triggers background requests; on exit, wait until no matching
+    XHR/fetch request has been in flight for `quiet_ms`.
+        with network_quiet(page, SCRAPER, 3, "sector level change"):
+            select.select_option(value="1")
+    """
+    watch = NetworkWatch(page, scraper, fixed_delay, reason, url_pattern, quiet_ms, timeout)
+    try:
+        yield
+        watch.wait()
+    finally:
+        watch.stop()
+
+def page_lanes(items, max_pages=MAX_PAGES):
+    """Deal `items` round-robin into at most `max_pages` lanes; each lane is walked on its own page."""
+    count = max(1, min(max_pages, len(items)))
+    return [items[i::count] for i in range(count)]
+
+def run_interleaved(tasks):
+    """
+    Drive several page workflows at once on one thread (sync Playwright cannot share pages
+    across threads). Each task is a generator that yields a zero-argument wait callable
+    wherever it would block; every task fires its next action before any wait is resolved,
+    so the pages load and update in parallel in the browser. An exception raised by a wait
+    is thrown back into its task at the yield, so the task's own try/except handles it.
+    """
+    outcomes = {task: None for task in tasks}
+    active = list(tasks)
+    while active:
+        waits = []
+        for task in list(active):
+            outcome = outcomes[task]
+            try:
+                wait = task.throw(outcome) if isinstance(outcome, Exception) else task.send(None)
+                waits.append((task, wait))
+            except StopIteration:
+                active.remove(task)
+        for task, wait in waits:
+            try:
+                wait()
+                outcomes[task] = None
+            except Exception as e:
+                outcomes[task] = e
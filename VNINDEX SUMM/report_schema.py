@@ -0,0 +1,189 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+from tracing import span, current_run_id
+import snapshot_store
+
+# Every scraper builds one report document and saves it twice, from the same data:
+# <prefix>_HHMM.json (for programs) and <prefix>_HHMM.md (rendered from the JSON, for people and Gemini).
+#
+# {
+#   "schema_version": 1,
+#   "scraper": "foreign_transaction",
+#   "title": "Foreign Investor Transactions",
+#   "source_url": "https://finance.vietstock.vn/...",
+#   "generated_at": "2025-10-16T15:05:12+07:00",
+#   "trading_date": "2025-10-16",                 <- null when the page does not show it
+#   "notes": ["Timeframe: 1 Day"],
+#   "sections": [
+#     {"type": "heading", "title": "Chứng khoán", "level": 2},
+#     {"type": "text", "title": "Chart Summary (1D)", "level": 3, "text": "..."},
+#     {"type": "table", "title": "Top Net Buy (Top Mua Ròng)", "level": 3, "note": null,
+#      "columns": ["Stock Code", "Value (Billion VND)"], "rows": [["STB", 120.5]], "number_format": "{:.2f}",
+#      "key_columns": [0],                          <- columns that name a record (see snapshot_store.py)
+#      "display_rows": [["STB", "120.50"]]}         <- only when the page text would not render back as shown
+#   ],
+#   "fingerprint": "9f2c..."                      <- sha256 of everything but generated_at (see fingerprint)
+# }
+# Table cells that are plain numbers ("1,234.5", "-0.26") are JSON numbers; anything with a unit
+# or sign text ("+1.2%", "12.3K") or a leading zero ("007") stays a string exactly as shown on the page.
+# Tables built from page text keep that text in display_rows when a parsed number would render
+# differently ("1,234.50" -> 1234.5), and the Markdown is rendered from it.
+
+SCHEMA_VERSION = 1
+VN_TZ = timezone(timedelta(hours=7))
+# No leading zero in the integer part ("0.5" is fine, "007" is a code)
+NUMBER = re.compile(r"^[+-]?([1-9]\d{0,2}(,\d{3})+|[1-9]\d*|0)(\.\d+)?$")
+DMY = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})")
+
+# Every report saved during a run is listed, one JSON line each, in OUTPUT_DIR/run_manifest_<run id>.jsonl;
+# cloud_runner publishes exactly those files (not whatever else sits in a reused output folder).
+_manifest_lock = threading.Lock()
+
+def new_report(scraper, title, source_url, notes=None):
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "scraper": scraper,
+        "title": title,
+        "source_url": source_url,
+        "generated_at": datetime.now(VN_TZ).isoformat(timespec="seconds"),
+        "trading_date": None,
+        "notes": notes or [],
+        "sections": []
+    }
+
+def add_heading(doc, title, level=2):
+    doc["sections"].append({"type": "heading", "title": title, "level": level})
+
+def add_text(doc, text, title=None, level=3):
+    doc["sections"].append({"type": "text", "title": title, "level": level, "text": text})
+
+def add_table(doc, title, columns, rows, level=3, note=None, number_format=None, key_columns=None, display_rows=None):
+    """
+    Pass the page text the rows were parsed from as `display_rows` (see parse_cells); it is
+    kept only if rendering the parsed rows would not reproduce it.
+    """
+    section = {"type": "table", "title": title, "level": level, "note": note,
+               "columns": list(columns), "rows": [list(r) for r in rows], "number_format": number_format,
+               "key_columns": key_columns or [0]}
+    if display_rows is not None:
+        display_rows = [["" if c is None else str(c) for c in r] for r in display_rows]
+        if display_rows != [[format_cell(c, number_format) for c in r] for r in section["rows"]]:
+            section["display_rows"] = display_rows
+    doc["sections"].append(section)
+
+def parse_number(text):
+    """"1,234.5" -> 1234.5, "-3" -> -3; anything else (including "007") is returned unchanged."""
+    if not isinstance(text, str):
+        return text
+    cleaned = text.strip().replace("−", "-")  # TradingView uses a real minus sign
+    if not NUMBER.match(cleaned):
+        return text
+    value = float(cleaned.replace(",", ""))
+    return int(value) if value.is_integer() and "." not in cleaned else value
+
+def parse_cells(rows):
+    return [[parse_number(c) for c in row] for row in rows]
+
+def iso_date(text):
+    """First dd/mm/yyyy date in `text` as yyyy-mm-dd, or None."""
+    match = DMY.search(text or "")
+    if not match:
+        return None
+    day, month, year = (int(g) for g in match.groups())
+    try:
+        return datetime(year, month, day).strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+def format_cell(value, number_format=None):
+    if value is None:
+        return ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if number_format:
+            return number_format.format(value)
+        return str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+    return str(value)
+
+def fingerprint(doc):
+    """Hash of the report's data: identical data gives the same value, whenever it was generated."""
+    data = {k: v for k, v in doc.items() if k not in ("generated_at", "fingerprint")}
+    return hashlib.sha256(json.dumps(data, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+def render_markdown(doc):
+    generated = datetime.fromisoformat(doc["generated_at"])
+    md = [f"# {doc['title']} - {generated.strftime('%Y-%m-%d %H:%M:%S')}\n"]
+    md.append(f"Source: {doc['source_url']}\n")
+    for note in doc["notes"]:
+        md.append(f"{note}\n")
+    md.append("\n")
+
+    for section in doc["sections"]:
+        hashes = "#" * section.get("level", 3)
+        if section["type"] == "heading":
+            md.append(f"{hashes} {section['title']}\n\n")
+        elif section["type"] == "text":
+            if section.get("title"):
+                md.append(f"{hashes} {section['title']}\n\n")
+            md.append(f"{section['text']}\n\n")
+        elif section["type"] == "table":
+            md.append(f"{hashes} {section['title']}\n\n")
+            if section.get("note"):
+                md.append(f"{section['note']}\n\n")
+            if not section["rows"]:
+                md.append("*No data found.*\n\n")
+                continue
+            columns = section["columns"]
+            md.append("| " + " | ".join(columns) + " |\n")
+            md.append("| " + " | ".join(["---"] * len(columns)) + " |\n")
+            rows = section.get("display_rows") or [[format_cell(c, section.get("number_format")) for c in row]
+                                                   for row in section["rows"]]
+            for cells in rows:
+                cells = list(cells)
+                cells += [""] * (len(columns) - len(cells))
+                md.append("| " + " | ".join(cells) + " |\n")
+            md.append("\n")
+    return "".join(md)
+
+def save_report(doc, output_dir, prefix):
+    """Write OUTPUT_DIR/YYYYMMDD/<prefix>_HHMM.json and the Markdown rendered from it. Returns the .md path."""
+    generated = datetime.fromisoformat(doc["generated_at"])
+    full_dir = os.path.join(output_dir, generated.strftime("%Y%m%d"))
+    os.makedirs(full_dir, exist_ok=True)
+    base = os.path.join(full_dir, f"{prefix}_{generated.strftime('%H%M')}")
+
+    with span(doc["scraper"], "format"):
+        doc["fingerprint"] = fingerprint(doc)
+        markdown = render_markdown(doc)
+    with span(doc["scraper"], "save"):
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(doc, f, ensure_ascii=False, indent=2)
+        with open(base + ".md", "w", encoding="utf-8") as f:
+            f.write(markdown)
+        snapshot_store.append_report(doc, output_dir)
+        record_saved(output_dir, doc, base)
+
+    print(f"Saved data to {base}.json")
+    print(f"Saved report to {base}.md")
+    return base + ".md"
+
+def run_manifest_path(output_dir, run_id=None):
+    return os.path.join(output_dir, f"run_manifest_{run_id or current_run_id()}.jsonl")
+
+def record_saved(output_dir, doc, base):
+    line = json.dumps({"scraper": doc["scraper"], "markdown": base + ".md", "data": base + ".json"}, ensure_ascii=False)
+    with _manifest_lock:
+        with open(run_manifest_path(output_dir), "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+def saved_reports(output_dir, run_id=None):
+    """The .md paths of the reports saved during the run, in the order they were saved."""
+    path = run_manifest_path(output_dir, run_id)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return list(dict.fromkeys(e["markdown"] for e in entries if os.path.exists(e["markdown"])))
@@ -0,0 +1,114 @@
+import os
+from urllib.parse import urlsplit
+from tracing import emit_span
+
+# --- Configuration ---
+# REQUEST_FILTER=0 lets every request through (e.g. to measure the baseline in har_bench.py)
+FILTER_ENABLED = os.getenv("REQUEST_FILTER", "1") != "0"
+
+# Nothing the scrapers read (Highcharts series, tables, SVG labels) needs these
+DEFAULT_BLOCK_TYPES = ["image", "media", "font"]
+
+# Ad networks and trackers seen on Vietstock / TradingView pages (matched with subdomains)
+AD_DOMAINS = [
+    "doubleclick.net",
+    "googlesyndication.com",
+    "googleadservices.com",
+    "googletagservices.com",
+    "googletagmanager.com",
+    "google-analytics.com",
+    "adservice.google.com",
+    "facebook.net",
+    "facebook.com",
+    "clarity.ms",
+    "hotjar.com",
+    "scorecardresearch.com",
+    "criteo.com",
+    "criteo.net",
+    "taboola.com",
+    "outbrain.com",
+    "amazon-adsystem.com",
+    "admicro.vn",
+    "vcmedia.vn",
+    "eclick.vn",
+    "adtima.vn",
+    "ambientplatform.vn",
+    "mc.yandex.ru",
+]
+
+DEFAULT_RULES = {
+    "block_types": DEFAULT_BLOCK_TYPES,
+    "allow_types": [],
+    "block_domains": AD_DOMAINS,
+    "allow_domains": [],
+}
+
+def domain_matches(host, domains):
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+class RequestFilter:
+    """
+    Aborts requests a scraper does not need and counts what was blocked.
+    Rules (a scraper's REQUEST_RULES, merged over DEFAULT_RULES):
+        allow_domains  never blocked
+        block_domains  always blocked
+        block_types    Playwright resource types to block, unless listed in allow_types
+    Blocked requests never reach the network, so their size is unknown; the report shows
+    the bytes that were loaded, which can be compared against a REQUEST_FILTER=0 run.
+    """
+
+    def __init__(self, context, scraper, rules=None):
+        self.context = context
+        self.scraper = scraper
+        self.rules = {**DEFAULT_RULES, **(rules or {})}
+        self.blocked = {}
+        self.requests = 0
+        self.bytes_loaded = 0
+        if FILTER_ENABLED:
+            context.route("**/*", self._route)
+        context.on("request", self._on_request)
+        context.on("response", self._on_response)
+
+    def block_reason(self, request):
+        host = urlsplit(request.url).hostname or ""
+        if domain_matches(host, self.rules["allow_domains"]):
+            return None
+        if domain_matches(host, self.rules["block_domains"]):
+            return "domain"
+        if request.resource_type in self.rules["block_types"] and request.resource_type not in self.rules["allow_types"]:
+            return request.resource_type
+        return None
+
+    def _route(self, route):
+        reason = self.block_reason(route.request)
+        if reason:
+            self.blocked[reason] = self.blocked.get(reason, 0) + 1
+            route.abort("blockedbyclient")
+        else:
+            # fallback() rather than continue_() so other routes (e.g. HAR replay) still apply
+            route.fallback()
+
+    def _on_request(self, request):
+        self.requests += 1
+
+    def _on_response(self, response):
+        length = response.headers.get("content-length")
+        if length and length.isdigit():
+            self.bytes_loaded += int(length)
+
+    def report(self):
+        """Stop listening, print the counts and emit them as a "requests" span."""
+        self.context.remove_listener("request", self._on_request)
+        self.context.remove_listener("response", self._on_response)
+        total_blocked = sum(self.blocked.values())
+        allowed = self.requests - total_blocked
+        detail = ", ".join(f"{k}: {v}" for k, v in sorted(self.blocked.items())) or "none"
+        print(f"[filter] {self.scraper}: blocked {total_blocked} request(s) ({detail}), "
+              f"allowed {allowed}, loaded {self.bytes_loaded / 1024:.0f} KB")
+        emit_span(self.scraper, "requests", 0, blocked=total_blocked, blocked_by=self.blocked,
+                  allowed=allowed, bytes_loaded=self.bytes_loaded, filter_enabled=FILTER_ENABLED)
+        return {"blocked": total_blocked, "allowed": allowed, "bytes_loaded": self.bytes_loaded}
+
+def block_requests(context, scraper, rules=None):
+    """Install a RequestFilter on `context`. Call .report() on the result when the scraper is done."""
+    return RequestFilter(context, scraper, rules)
@@ -7,11 +7,13 @@ import re
 from xml.etree import ElementTree
 import requests
 from playwright.sync_api import sync_playwright
+from tracing import span
 
 # Fix encoding for Windows
 sys.stdout.reconfigure(encoding='utf-8')
 
 # --- Configuration ---
+SCRAPER = "rss_news"
 RSS_SOURCES = {
     "CafeF": "https://cafef.vn/vi-mo-dau-tu.rss",
     "Vietstock": "https://vietstock.vn/768/kinh-te/kinh-te-dau-tu.rss",
@@ -143,7 +145,8 @@ def main():
     for source_name, rss_url in RSS_SOURCES.items():
         print(f"[*] Processing {source_name}...")
         try:
-            resp = requests.get(rss_url, headers=headers, timeout=15)
+            with span(SCRAPER, "rss_fetch", source=source_name):
+                resp = requests.get(rss_url, headers=headers, timeout=15)
             if resp.status_code != 200:
                 print(f"    [!] Failed to fetch RSS: {resp.status_code}")
                 continue
@@ -196,7 +199,8 @@ def main():
                 
                 for idx, news in enumerate(items):
                     print(f"    - [{source_name}] Item {idx+1}/{len(items)}: {news['title'][:50]}...")
-                    content = extract_article_content(page, news["link"])
+                    with span(SCRAPER, "article_extract", source=source_name):
+                        content = extract_article_content(page, news["link"])
                     
                     report.append(f"### {idx+1}. {news['title']}\n")
                     report.append(f"- **Link**: {news['link']}\n")
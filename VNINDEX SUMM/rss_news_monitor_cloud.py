@@ -11,8 +11,14 @@ from xml.etree import ElementTree
 import requests
 from flask import Flask, jsonify, request
 from playwright.sync_api import sync_playwright
+# Long-lived service: spans would grow one trace file (in memory-backed /tmp on Cloud Run)
+# for the life of the instance, so tracing is off here unless TRACING=1 is set explicitly
+os.environ.setdefault("TRACING", "0")
+from tracing import span
+from storage_backend import open_backend
 
 # --- Configuration ---
+SCRAPER = "rss_monitor"
 RSS_SOURCES = {
     "CafeF": "https://cafef.vn/vi-mo-dau-tu.rss",
     "Vietstock": "https://vietstock.vn/768/kinh-te/kinh-te-dau-tu.rss",
@@ -34,38 +40,20 @@ mock_gcs_dir = "gcs_mock"
 app = Flask(__name__)
 
 # --- Storage Abstraction ---
+def storage():
+    """GCS, or the local mock folder in local mode (see storage_backend.py)."""
+    return open_backend(bucket_name, local_dir=mock_gcs_dir if is_local else None)
+
 def load_from_storage(filename):
     """Load text content from GCS or Local Mock"""
-    if is_local:
-        local_path = os.path.join(mock_gcs_dir, filename)
-        if os.path.exists(local_path):
-            with open(local_path, "r", encoding="utf-8") as f:
-                return f.read()
-        return None
-    else:
-        from google.cloud import storage
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
-        blob = bucket.blob(filename)
-        if blob.exists():
-            return blob.download_as_text(encoding="utf-8")
-        return None
+    return storage().read_text(filename)
 
-def save_to_storage(filename, content):
-    """Save text content to GCS or Local Mock"""
-    if is_local:
-        local_path = os.path.join(mock_gcs_dir, filename)
-        os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        with open(local_path, "w", encoding="utf-8") as f:
-            f.write(content)
-        print(f"[Local] Saved to {local_path}")
-    else:
-        from google.cloud import storage
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
-        blob = bucket.blob(filename)
-        blob.upload_from_string(content, content_type="text/markdown")
-        print(f"[Cloud] Uploaded to gs://{bucket_name}/{filename}")
+def save_to_storage(files):
+    """Save {filename: text content} to GCS or Local Mock, concurrently"""
+    backend = storage()
+    backend.write_many(files, content_type="text/markdown")
+    for filename in files:
+        print(f"[{'Local' if is_local else 'Cloud'}] Saved to {backend.uri(filename)}")
 
 # --- Helper Logic ---
 def get_current_date_info():
@@ -110,23 +98,24 @@ def extract_article_content_playwright(items):
             for item in items:
                 url = item['link']
                 try:
-                    page.goto(url, timeout=30000, wait_until="domcontentloaded")
-                    content = page.evaluate("""() => {
-                        const noise = document.querySelectorAll('script, style, iframe, nav, header, footer, .sidebar, .ads, .comment');
-                        noise.forEach(el => el.remove());
-                        const selectors = ['article', '.article-content', '.content-detail', '#main-detail-content', '[itemprop="articleBody"]'];
-                        for (let s of selectors) {
-                            let el = document.querySelector(s);
-                            if (el && el.innerText.length > 200) return el.innerText;
-                        }
-                        let bestDiv = null, maxP = 0;
-                        document.querySelectorAll('div').forEach(div => {
-                            let p = div.querySelectorAll('p').length;
-                            if (p > maxP) { maxP = p; bestDiv = div; }
-                        });
-                        return (bestDiv && bestDiv.innerText.length > 200) ? bestDiv.innerText : document.body.innerText;
-                    }""")
-                    results[item['hash']] = re.sub(r'\n{3,}', '\n\n', content).strip()
+                    with span(SCRAPER, "article_extract", source=item['source']):
+                        page.goto(url, timeout=30000, wait_until="domcontentloaded")
+                        content = page.evaluate("""() => {
+                            const noise = document.querySelectorAll('script, style, iframe, nav, header, footer, .sidebar, .ads, .comment');
+                            noise.forEach(el => el.remove());
+                            const selectors = ['article', '.article-content', '.content-detail', '#main-detail-content', '[itemprop="articleBody"]'];
+                            for (let s of selectors) {
+                                let el = document.querySelector(s);
+                                if (el && el.innerText.length > 200) return el.innerText;
+                            }
+                            let bestDiv = null, maxP = 0;
+                            document.querySelectorAll('div').forEach(div => {
+                                let p = div.querySelectorAll('p').length;
+                                if (p > maxP) { maxP = p; bestDiv = div; }
+                            });
+                            return (bestDiv && bestDiv.innerText.length > 200) ? bestDiv.innerText : document.body.innerText;
+                        }""")
+                        results[item['hash']] = re.sub(r'\n{3,}', '\n\n', content).strip()
                 except:
                     results[item['hash']] = "Content extraction failed."
             browser.close()
@@ -154,7 +143,8 @@ def run_job():
     for source, url in RSS_SOURCES.items():
         try:
             # We could implement ETag/Last-Modified here using state info if we saved it
-            resp = requests.get(url, timeout=10)
+            with span(SCRAPER, "rss_fetch", source=source):
+                resp = requests.get(url, timeout=10)
             if resp.status_code != 200: continue
             
             root = ElementTree.fromstring(resp.content)
@@ -208,8 +198,11 @@ def run_job():
         full_report = current_report + append_text
         
         # 4. Save Updates
-        save_to_storage(report_file, full_report)
-        save_to_storage(state_file, json.dumps(state, ensure_ascii=False, indent=2))
+        save_to_storage({
+            report_file: full_report,
+            state_file: json.dumps(state, ensure_ascii=False, indent=2)
+        })
+        storage().print_metrics()
         
         return jsonify({"status": "success", "new_items": len(new_items)})
     
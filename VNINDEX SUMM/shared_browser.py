@@ -0,0 +1,185 @@
+import asyncio
+import importlib
+import os
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlparse
+from playwright.sync_api import sync_playwright
+
+# --- Configuration ---
+# Scripts that expose a run(context) entry point and can share one Chromium.
+BROWSER_SCRIPTS = [
+    "vietstock_market_summary.py",
+    "vietstock_liquidity_summary.py",
+    "vietstock_top_influence.py",
+    "vietstock_foreign_transaction.py",
+    "vietstock_proprietary_trading.py",
+    "vietstock_sector_data.py",
+    "tradingview_vnindex_technicals.py",
+]
+
+# Concurrent mode limits: total scrapers in flight (contexts in the one shared Chromium),
+# and scrapers in flight per host
+MAX_CONCURRENCY = int(os.getenv("SCRAPER_MAX_CONCURRENCY", "4"))
+PER_HOST_LIMIT = int(os.getenv("SCRAPER_PER_HOST_LIMIT", "2"))
+
+def is_browser_script(script):
+    return script in BROWSER_SCRIPTS
+
+def load_scraper(script):
+    """Import a scraper module by its script filename."""
+    module_name = os.path.splitext(os.path.basename(script))[0]
+    return importlib.import_module(module_name)
+
+def run_scraper(browser, script):
+    """Run one scraper in a fresh BrowserContext of the shared browser. Returns the saved path."""
+    module = load_scraper(script)
+    context = browser.new_context(**getattr(module, "CONTEXT_OPTIONS", {}))
+    try:
+        return module.run(context)
+    finally:
+        context.close()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class BrowserWorkerPool:
+    """
+    Worker threads that each run one scraper at a time in a fresh BrowserContext of a single
+    shared Chromium. Sync Playwright objects are bound to the thread that created them, so
+    a host thread launches the browser with a DevTools port and every worker attaches to it
+    with its own driver (connect_over_cdp). Only the driver (a small node process) is per
+    worker; N workers cost N contexts in one browser, not N browsers.
+    A pool of one skips CDP and launches the browser in its only worker.
+    """
+
+    def __init__(self, size):
+        self.size = max(1, size)
+        self.jobs = queue.Queue()
+        self.launch_lock = threading.Lock()
+        self.endpoint = None
+        self.launch_error = None
+        self.stopped = threading.Event()
+        self.host = None
+        self.threads = [threading.Thread(target=self._work, daemon=True) for _ in range(self.size)]
+        for t in self.threads:
+            t.start()
+
+    def _host_browser(self, ready):
+        try:
+            with sync_playwright() as p:
+                port = free_port()
+                browser = p.chromium.launch(headless=True, args=[f"--remote-debugging-port={port}"])
+                try:
+                    self.endpoint = f"http://127.0.0.1:{port}"
+                    ready.set()
+                    self.stopped.wait()
+                finally:
+                    browser.close()
+        except Exception as e:
+            self.launch_error = e
+        finally:
+            ready.set()
+
+    def shared_endpoint(self):
+        """CDP endpoint of the shared browser, launched on first use."""
+        with self.launch_lock:
+            if self.host is None:
+                ready = threading.Event()
+                self.host = threading.Thread(target=self._host_browser, args=(ready,), daemon=True)
+                self.host.start()
+                ready.wait()
+        if self.endpoint is None:
+            raise self.launch_error or RuntimeError("shared browser did not start")
+        return self.endpoint
+
+    def _connect(self, playwright):
+        if self.size == 1:
+            return playwright.chromium.launch(headless=True)
+        return playwright.chromium.connect_over_cdp(self.shared_endpoint())
+
+    def _work(self):
+        playwright, browser, launch_error = None, None, None
+        try:
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    break
+                fn, future = job
+                # Connected on the first job, so a pool that gets no browser job never starts Chromium
+                if browser is None and launch_error is None:
+                    try:
+                        playwright = sync_playwright().start()
+                        browser = self._connect(playwright)
+                    except Exception as e:
+                        launch_error = e
+                if launch_error:
+                    future.set_exception(launch_error)
+                    continue
+                try:
+                    future.set_result(fn(browser))
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            # For a CDP connection this only disconnects; the host thread closes the browser
+            if browser:
+                browser.close()
+            if playwright:
+                playwright.stop()
+
+    def submit(self, fn):
+        """Run fn(browser) on the next free worker. Returns a concurrent.futures.Future."""
+        future = Future()
+        self.jobs.put((fn, future))
+        return future
+
+    def close(self):
+        for _ in self.threads:
+            self.jobs.put(None)
+        for t in self.threads:
+            t.join()
+        self.stopped.set()
+        if self.host:
+            self.host.join()
+
+def scraper_host(script):
+    module = load_scraper(script)
+    return urlparse(getattr(module, "URL", "")).netloc
+
+def make_host_slots(scripts, per_host_limit=PER_HOST_LIMIT):
+    """One asyncio.Semaphore per scraper host. Imports every scraper up front, on the calling thread."""
+    hosts = {scraper_host(script) for script in scripts}
+    return {host: asyncio.Semaphore(per_host_limit) for host in hosts}
+
+def open_pool(mode, scripts):
+    """
+    Browser pool and host slots for the runners' job graph: one scraper at a time for
+    "inprocess", up to MAX_CONCURRENCY contexts of the same browser with per-host limits
+    for "concurrent".
+    Call from inside the event loop.
+    """
+    browser_scripts = [s for s in scripts if is_browser_script(s)]
+    if mode == "concurrent":
+        return BrowserWorkerPool(min(MAX_CONCURRENCY, len(browser_scripts))), make_host_slots(browser_scripts, PER_HOST_LIMIT)
+    return BrowserWorkerPool(1), make_host_slots(browser_scripts, 1)
+
+async def run_bounded(pool, script, host_slots):
+    """Run one scraper on the pool once its host has a free slot. Returns the saved path or None."""
+    async with host_slots[scraper_host(script)]:
+        print(f"[*] Starting {script}...")
+        started = time.perf_counter()
+        try:
+            path = await asyncio.wrap_future(pool.submit(lambda browser: run_scraper(browser, script)))
+        except Exception as e:
+            print(f"[-] Error in {script} ({time.perf_counter() - started:.1f}s): {e}")
+            return None
+        if path:
+            print(f"[+] Success: {script} ({time.perf_counter() - started:.1f}s)")
+        else:
+            print(f"[-] Error in {script} ({time.perf_counter() - started:.1f}s): no report saved")
+        return path
@@ -0,0 +1,190 @@
+import os
+import re
+import sys
+import glob
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+# --- Configuration ---
+# SNAPSHOT_STORE=0 stops the scrapers from appending their reports to the store
+STORE_ENABLED = os.getenv("SNAPSHOT_STORE", "1") != "0"
+DB_FILENAME = "snapshots.sqlite"
+# Defaults to OUTPUT_DIR/snapshots.sqlite; cloud_runner syncs it with the bucket
+DB_PATH = os.getenv("SNAPSHOT_DB")
+VN_TZ = timezone(timedelta(hours=7))
+
+# Every table row of every saved report (report_schema document) is appended, one row per cell,
+# to a table named after the scraper (the dataset):
+#
+#   trading_date  snapshot_at                 section                       row_no  key  field                value  text
+#   2025-10-16    2025-10-16T15:05:12+07:00   Top Net Buy (Top Mua Ròng)    0       HPG  Value (Billion VND)  120.5  120.5
+#
+# `key` is the row's name (stock code, sector, category); `value` is set for numeric cells and
+# `text` keeps the cell as saved. A table's key_columns split rows that hold several records
+# (top influence: gainer and loser side by side). Rows are never updated or deleted: each run adds
+# a snapshot, and the queries below read the latest snapshot of each trading day.
+#
+# The `snapshots` table lists every report appended, so the same report is never added twice.
+
+_lock = threading.Lock()
+
+def db_path(output_dir=None):
+    if DB_PATH:
+        return DB_PATH
+    return os.path.join(output_dir or os.getenv("OUTPUT_DIR", os.path.join(os.getcwd(), "output")), DB_FILENAME)
+
+def table_name(dataset):
+    return re.sub(r"\W", "_", dataset)
+
+def connect(path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Subprocess-mode scrapers write from separate processes; wait for each other's locks
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("""CREATE TABLE IF NOT EXISTS snapshots (
+        dataset TEXT NOT NULL, trading_date TEXT NOT NULL, snapshot_at TEXT NOT NULL,
+        title TEXT, source_url TEXT, PRIMARY KEY (dataset, snapshot_at))""")
+    return conn
+
+def ensure_table(conn, dataset):
+    name = table_name(dataset)
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS "{name}" (
+        trading_date TEXT NOT NULL, snapshot_at TEXT NOT NULL, section TEXT NOT NULL,
+        row_no INTEGER NOT NULL, key TEXT, field TEXT NOT NULL, value REAL, text TEXT)""")
+    conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}_key" ON "{name}" (key, trading_date)')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}_date" ON "{name}" (trading_date, snapshot_at)')
+    return name
+
+def trading_date(doc):
+    """The date the page showed, else the VN date the report was generated."""
+    return doc.get("trading_date") or datetime.fromisoformat(doc["generated_at"]).astimezone(VN_TZ).strftime("%Y-%m-%d")
+
+def cell_records(section):
+    """Yield (row_no, key, field, value, text) for every cell of a table section, keys excluded."""
+    columns = section["columns"]
+    starts = section.get("key_columns") or [0]
+    display_rows = section.get("display_rows")
+    for row_no, row in enumerate(section["rows"]):
+        for n, start in enumerate(starts):
+            end = starts[n + 1] if n + 1 < len(starts) else len(columns)
+            key = row[start] if start < len(row) else None
+            if key is None:
+                continue
+            for i in range(start + 1, min(end, len(row))):
+                cell = row[i]
+                if cell is None:
+                    continue
+                number = cell if isinstance(cell, (int, float)) and not isinstance(cell, bool) else None
+                text = display_rows[row_no][i] if display_rows else str(cell)
+                yield row_no, str(key), columns[i], number, text
+
+def append(doc, path=None):
+    """Append the table rows of one report document. Returns the number of cells added (0 if already stored)."""
+    dataset = doc["scraper"]
+    date = trading_date(doc)
+    with _lock:
+        conn = connect(path or db_path())
+        try:
+            with conn:
+                added = conn.execute("INSERT OR IGNORE INTO snapshots VALUES (?, ?, ?, ?, ?)",
+                                     (dataset, date, doc["generated_at"], doc.get("title"), doc.get("source_url"))).rowcount
+                if not added:
+                    return 0
+                name = ensure_table(conn, dataset)
+                rows = [(date, doc["generated_at"], section["title"]) + record
+                        for section in doc["sections"] if section["type"] == "table"
+                        for record in cell_records(section)]
+                conn.executemany(f'INSERT INTO "{name}" VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                return len(rows)
+        finally:
+            conn.close()
+
+def append_report(doc, output_dir):
+    """save_report() hook: never lets a store problem lose the report itself."""
+    if not STORE_ENABLED:
+        return
+    try:
+        count = append(doc, db_path(output_dir))
+        print(f"[store] {doc['scraper']}: {count} value(s) appended")
+    except Exception as e:
+        print(f"[store] Could not append {doc['scraper']}: {e}")
+
+def ingest(directory, path=None):
+    """Backfill the store from saved report .json files (skips reports already stored)."""
+    total = 0
+    for file in sorted(glob.glob(os.path.join(directory, "**", "*.json"), recursive=True)):
+        with open(file, "r", encoding="utf-8") as f:
+            try:
+                doc = json.load(f)
+            except ValueError:
+                continue
+        if isinstance(doc, dict) and "schema_version" in doc and "sections" in doc:
+            total += append(doc, path)
+    return total
+
+# --- Queries ---
+
+def latest_snapshots(name, days):
+    """SQL for the latest snapshot of each of the last `days` trading days of a table."""
+    return f"""SELECT trading_date, MAX(snapshot_at) AS snapshot_at FROM "{name}"
+        GROUP BY trading_date ORDER BY trading_date DESC LIMIT {int(days)}"""
+
+def daily_values(dataset, key, field=None, section=None, days=20, path=None):
+    """
+    A key's values over the last `days` trading days, from each day's latest snapshot:
+    [(trading_date, section, field, value)], oldest first. E.g. 20-day foreign net flow of HPG:
+        daily_values("foreign_transaction", "HPG")
+    """
+    conn = connect(path or db_path())
+    try:
+        name = ensure_table(conn, dataset)
+        sql = f"""SELECT t.trading_date, t.section, t.field, t.value FROM "{name}" t
+            JOIN ({latest_snapshots(name, days)}) s
+              ON t.trading_date = s.trading_date AND t.snapshot_at = s.snapshot_at
+            WHERE t.key = ?"""
+        params = [key]
+        if field:
+            sql += " AND t.field = ?"
+            params.append(field)
+        if section:
+            sql += " AND t.section LIKE ?"
+            params.append(f"%{section}%")
+        return conn.execute(sql + " ORDER BY t.trading_date, t.section, t.row_no", params).fetchall()
+    finally:
+        conn.close()
+
+def daily_totals(dataset, key, field=None, section=None, days=20, path=None):
+    """daily_values() summed per trading day: [(trading_date, total)], oldest first."""
+    totals = {}
+    for date, _, _, value in daily_values(dataset, key, field, section, days, path):
+        if value is not None:
+            totals[date] = totals.get(date, 0) + value
+    return sorted(totals.items())
+
+def datasets(path=None):
+    """(dataset, snapshots, first trading date, last trading date) for everything stored."""
+    conn = connect(path or db_path())
+    try:
+        return conn.execute("""SELECT dataset, COUNT(*), MIN(trading_date), MAX(trading_date)
+            FROM snapshots GROUP BY dataset ORDER BY dataset""").fetchall()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    # python snapshot_store.py ingest <OUTPUT_DIR>            -> backfill from saved .json reports
+    # python snapshot_store.py query <dataset> <key> [days]   -> e.g. query foreign_transaction HPG 20
+    # python snapshot_store.py list
+    sys.stdout.reconfigure(encoding='utf-8')
+    args = sys.argv[1:]
+    if len(args) == 2 and args[0] == "ingest":
+        print(f"Appended {ingest(args[1])} value(s) to {db_path()}")
+    elif len(args) in (3, 4) and args[0] == "query":
+        days = int(args[3]) if len(args) == 4 else 20
+        for date, section, field, value in daily_values(args[1], args[2], days=days):
+            print(f"{date}  {section} / {field}: {value}")
+    elif args == ["list"]:
+        for dataset, count, first, last in datasets():
+            print(f"{dataset}: {count} snapshot(s), {first} .. {last}")
+    else:
+        print("Usage: python snapshot_store.py ingest <dir> | query <dataset> <key> [days] | list")
@@ -0,0 +1,325 @@
+import os
+import sys
+import time
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tracing import emit_span
+from trace_report import percentile
+
+# --- Configuration ---
+# STORAGE_BACKEND=local keeps every object in STORAGE_LOCAL_DIR instead of GCS (offline runs and benchmarks)
+BACKEND = os.getenv("STORAGE_BACKEND", "gcs").lower()
+LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR", os.path.join(os.getcwd(), "gcs_local"))
+# Threads for the bulk operations, and HTTP connections kept open to GCS
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", "8"))
+# STORAGE_CACHE_DIR turns on the read-through cache; entries older than STORAGE_CACHE_TTL seconds are re-read
+CACHE_DIR = os.getenv("STORAGE_CACHE_DIR")
+CACHE_TTL = int(os.getenv("STORAGE_CACHE_TTL", "300"))
+
+class StorageBackend:
+    """
+    Object storage for the runner, the RSS monitor and the brief generator. Subclasses implement
+    the single-object operations (_exists, _read, _write, _upload, _download, _copy, _list);
+    this class adds bulk versions on a shared thread pool, the optional read-through cache and
+    per-operation latency metrics (also emitted as "storage" spans).
+    """
+
+    name = "storage"
+
+    def __init__(self, workers=STORAGE_WORKERS, cache_dir=CACHE_DIR, cache_ttl=CACHE_TTL):
+        self.workers = workers
+        self.cache_dir = cache_dir
+        self.cache_ttl = cache_ttl
+        self.metrics = {}
+        self.cache_hits = 0
+        self._metrics_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def uri(self, name):
+        return name
+
+    # --- Metrics ---
+
+    def _timed(self, op, name, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - t0
+            with self._metrics_lock:
+                self.metrics.setdefault(op, []).append(elapsed * 1000)
+            emit_span("storage", op, elapsed, backend=self.name, blob=name)
+
+    def metrics_summary(self):
+        """{op: {"count", "total_ms", "p50_ms", "p95_ms"}} for every operation done so far."""
+        with self._metrics_lock:
+            return {op: {"count": len(ms), "total_ms": round(sum(ms), 1),
+                         "p50_ms": round(percentile(ms, 50), 1), "p95_ms": round(percentile(ms, 95), 1)}
+                    for op, ms in sorted(self.metrics.items())}
+
+    def print_metrics(self):
+        print(f"[storage] {self.name} latency (ms):")
+        for op, m in self.metrics_summary().items():
+            print(f"  {op:<10} n={m['count']:<4} p50={m['p50_ms']:>8.1f}  p95={m['p95_ms']:>8.1f}  total={m['total_ms']:>9.1f}")
+        if self.cache_dir:
+            print(f"  cache hits: {self.cache_hits}")
+
+    # --- Read-through cache ---
+
+    def _cache_path(self, name):
+        return os.path.join(self.cache_dir, *name.split("/"))
+
+    def _cached(self, name):
+        if not self.cache_dir:
+            return None
+        path = self._cache_path(name)
+        if not os.path.exists(path) or time.time() - os.path.getmtime(path) > self.cache_ttl:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def _store_cache(self, name, content):
+        if not self.cache_dir:
+            return
+        path = self._cache_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def _drop_cache(self, name):
+        if self.cache_dir and os.path.exists(self._cache_path(name)):
+            os.remove(self._cache_path(name))
+
+    # --- Single-object operations ---
+
+    def exists(self, name):
+        return self._timed("exists", name, self._exists, name)
+
+    def read_text(self, name, default=None):
+        """The object as text, or `default` when it does not exist."""
+        cached = self._cached(name)
+        if cached is not None:
+            with self._metrics_lock:
+                self.cache_hits += 1
+            return cached
+        content = self._timed("read", name, self._read, name)
+        if content is None:
+            return default
+        self._store_cache(name, content)
+        return content
+
+    def write_text(self, name, content, content_type="text/plain; charset=utf-8"):
+        self._timed("write", name, self._write, name, content, content_type)
+        self._store_cache(name, content)
+
+    def upload_file(self, local_path, name, content_type=None):
+        self._timed("upload", name, self._upload, local_path, name, content_type)
+        self._drop_cache(name)
+
+    def download_file(self, name, local_path):
+        """Download to `local_path`. Returns False when the object does not exist."""
+        return self._timed("download", name, self._download, name, local_path)
+
+    def copy(self, source_name, destination_name):
+        """Copy inside the storage (server-side on GCS)."""
+        self._timed("copy", destination_name, self._copy, source_name, destination_name)
+        self._drop_cache(destination_name)
+
+    def list(self, prefix="", suffix=""):
+        """Object names under `prefix` ending with `suffix`, sorted."""
+        names = self._timed("list", prefix, self._list, prefix)
+        return sorted(n for n in names if n.endswith(suffix))
+
+    # --- Bulk operations ---
+
+    @property
+    def executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="storage")
+            return self._executor
+
+    def map(self, fn, items):
+        """fn over items on the storage pool; results in input order."""
+        items = list(items)
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        return list(self.executor.map(fn, items))
+
+    def read_many(self, names, default=None):
+        """{name: text} for every name, read concurrently, in the order given."""
+        names = list(names)
+        return dict(zip(names, self.map(lambda n: self.read_text(n, default), names)))
+
+    def write_many(self, items, content_type="text/plain; charset=utf-8"):
+        """Write {name: text} concurrently."""
+        self.map(lambda item: self.write_text(item[0], item[1], content_type), list(items.items()))
+
+    def upload_many(self, files):
+        """Upload [(local_path, name, content_type)] concurrently."""
+        self.map(lambda f: self.upload_file(*f), files)
+
+    def close(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+class GcsBackend(StorageBackend):
+    """One google.cloud.storage client per bucket, its connection pool sized for the bulk operations."""
+
+    name = "gcs"
+
+    def __init__(self, bucket_name, **kwargs):
+        super().__init__(**kwargs)
+        self.bucket_name = bucket_name
+        self._bucket = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def bucket(self):
+        with self._client_lock:
+            if self._bucket is None:
+                from google.cloud import storage
+                client = storage.Client()
+                try:
+                    import requests
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+                    client._http.mount("https://", adapter)
+                except Exception:
+                    pass
+                self._bucket = client.bucket(self.bucket_name)
+            return self._bucket
+
+    def uri(self, name):
+        return f"gs://{self.bucket_name}/{name}"
+
+    def _exists(self, name):
+        return self.bucket.blob(name).exists()
+
+    def _read(self, name):
+        from google.api_core.exceptions import NotFound
+        try:
+            return self.bucket.blob(name).download_as_text(encoding="utf-8")
+        except NotFound:
+            return None
+
+    def _write(self, name, content, content_type):
+        self.bucket.blob(name).upload_from_string(content, content_type=content_type)
+
+    def _upload(self, local_path, name, content_type):
+        # Explicitly set UTF-8 content type to fix browser rendering issues
+        self.bucket.blob(name).upload_from_filename(local_path, content_type=content_type)
+
+    def _download(self, name, local_path):
+        blob = self.bucket.blob(name)
+        if not blob.exists():
+            return False
+        blob.download_to_filename(local_path)
+        return True
+
+    def _copy(self, source_name, destination_name):
+        self.bucket.copy_blob(self.bucket.blob(source_name), self.bucket, destination_name)
+
+    def _list(self, prefix):
+        return [blob.name for blob in self.bucket.list_blobs(prefix=prefix)]
+
+class LocalBackend(StorageBackend):
+    """Objects are files under `root`, named by their path relative to it."""
+
+    name = "local"
+
+    def __init__(self, root, **kwargs):
+        super().__init__(**kwargs)
+        self.root = os.path.abspath(root)
+        self.content_types = {}
+
+    def path(self, name):
+        return os.path.join(self.root, *name.split("/"))
+
+    def uri(self, name):
+        return self.path(name)
+
+    def _exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def _read(self, name):
+        if not os.path.exists(self.path(name)):
+            return None
+        with open(self.path(name), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def _write(self, name, content, content_type):
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        with open(self.path(name), "w", encoding="utf-8") as f:
+            f.write(content)
+        self.content_types[name] = content_type
+
+    def _upload(self, local_path, name, content_type):
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        shutil.copyfile(local_path, self.path(name))
+        self.content_types[name] = content_type
+
+    def _download(self, name, local_path):
+        if not os.path.exists(self.path(name)):
+            return False
+        shutil.copyfile(self.path(name), local_path)
+        return True
+
+    def _copy(self, source_name, destination_name):
+        os.makedirs(os.path.dirname(self.path(destination_name)), exist_ok=True)
+        shutil.copyfile(self.path(source_name), self.path(destination_name))
+        self.content_types[destination_name] = self.content_types.get(source_name)
+
+    def _list(self, prefix):
+        # Walk only the deepest folder the prefix names
+        base = prefix.rsplit("/", 1)[0] if "/" in prefix else ""
+        names = []
+        for folder, _, files in os.walk(self.path(base) if base else self.root):
+            for file in files:
+                name = os.path.relpath(os.path.join(folder, file), self.root).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    names.append(name)
+        return names
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def open_backend(bucket_name, local_dir=None):
+    """
+    The shared backend for a bucket: GCS, or LocalBackend(local_dir or STORAGE_LOCAL_DIR) when
+    STORAGE_BACKEND=local or a component passes its own local folder. One instance (one client,
+    one pool, one set of metrics) per bucket/folder for the whole process.
+    """
+    if BACKEND == "local" or local_dir:
+        key = ("local", os.path.abspath(local_dir or LOCAL_DIR))
+    else:
+        key = ("gcs", bucket_name)
+    with _backends_lock:
+        if key not in _backends:
+            _backends[key] = LocalBackend(key[1]) if key[0] == "local" else GcsBackend(bucket_name)
+        return _backends[key]
+
+def print_all_metrics():
+    for backend in list(_backends.values()):
+        if backend.metrics:
+            backend.print_metrics()
+
+if __name__ == "__main__":
+    # python storage_backend.py bench <dir> [files] [kb]  -> time the bulk operations on a local backend
+    if len(sys.argv) >= 3 and sys.argv[1] == "bench":
+        count = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+        size_kb = int(sys.argv[4]) if len(sys.argv) > 4 else 20
+        backend = LocalBackend(sys.argv[2])
+        items = {f"bench/file_{i:03d}.md": "x" * size_kb * 1024 for i in range(count)}
+        t0 = time.perf_counter()
+        backend.write_many(items)
+        names = backend.list("bench/", ".md")
+        backend.read_many(names)
+        print(f"[storage] {count} x {size_kb} KB written, listed and read in {time.perf_counter() - t0:.2f}s")
+        backend.print_metrics()
+        backend.close()
+    else:
+        print("Usage: python storage_backend.py bench <dir> [files] [kb]")
@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import math
+import time
+from tracing import trace_dir, current_run_id, spans_path
+
+# --- Configuration ---
+HISTORY_FILENAME = "perf_history.jsonl"
+# How many past runs the p50/p95 report looks at
+HISTORY_RUNS = int(os.getenv("PERF_HISTORY_RUNS", "30"))
+
+def history_path():
+    return os.path.join(trace_dir(), HISTORY_FILENAME)
+
+def load_spans(run_id):
+    path = spans_path(run_id)
+    if not os.path.exists(path):
+        return []
+    spans = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+    return spans
+
+def stage_key(s):
+    # Sleeps and extraction parts are split by reason/part so the dominant one stands out
+    detail = s.get("reason") or s.get("part")
+    key = f"{s['scraper']}/{s['stage']}"
+    return f"{key} ({detail})" if detail else key
+
+def summarize_run(run_id):
+    """Total milliseconds per scraper/stage for one run."""
+    totals = {}
+    for s in load_spans(run_id):
+        key = stage_key(s)
+        totals[key] = round(totals.get(key, 0) + s["duration_ms"], 1)
+    return {"run_id": run_id, "recorded_at": time.time(), "stages": totals}
+
+def append_history(summary):
+    os.makedirs(trace_dir(), exist_ok=True)
+    with open(history_path(), "a", encoding="utf-8") as f:
+        f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+
+def load_history(limit=HISTORY_RUNS):
+    if not os.path.exists(history_path()):
+        return []
+    with open(history_path(), "r", encoding="utf-8") as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    return runs[-limit:]
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def format_report(history):
+    if not history:
+        return "No performance history recorded yet."
+
+    samples = {}
+    for run in history:
+        for key, ms in run["stages"].items():
+            samples.setdefault(key, []).append(ms)
+    last = history[-1]["stages"]
+
+    rows = sorted(samples.items(), key=lambda kv: percentile(kv[1], 50), reverse=True)
+    lines = [f"Performance over the last {len(history)} run(s) (latest: {history[-1]['run_id']})", ""]
+    lines.append(f"{'Stage':<60} {'Runs':>5} {'p50 s':>8} {'p95 s':>8} {'Last s':>8}")
+    for key, values in rows:
+        last_s = f"{last[key] / 1000:.2f}" if key in last else "-"
+        lines.append(f"{key:<60} {len(values):>5} {percentile(values, 50) / 1000:>8.2f} "
+                     f"{percentile(values, 95) / 1000:>8.2f} {last_s:>8}")
+    return "\n".join(lines)
+
+def record_run(run_id=None):
+    """Add this run's totals to the history file and print the report. Returns the report text."""
+    summary = summarize_run(run_id or current_run_id())
+    if summary["stages"]:
+        append_history(summary)
+    report = format_report(load_history())
+    print(report)
+    return report
+
+if __name__ == "__main__":
+    # python trace_report.py            -> report from history
+    # python trace_report.py <run_id>   -> record that run first
+    if len(sys.argv) > 1:
+        record_run(sys.argv[1])
+    else:
+        print(format_report(load_history()))
@@ -0,0 +1,80 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+# --- Configuration ---
+# Spans are appended as JSON lines to TRACE_DIR (default OUTPUT_DIR/traces)/spans_<run id>.jsonl.
+# Runners export TRACE_RUN_ID so scrapers started as subprocesses write to the same run.
+TRACING_ENABLED = os.getenv("TRACING", "1") != "0"
+
+_write_lock = threading.Lock()
+
+def trace_dir():
+    # Resolved per call: runners set OUTPUT_DIR after this module may have been imported
+    return os.getenv("TRACE_DIR") or os.path.join(os.getenv("OUTPUT_DIR", os.path.join(os.getcwd(), "output")), "traces")
+
+def new_run_id():
+    return datetime.now(timezone(timedelta(hours=7))).strftime("%Y%m%d_%H%M%S")
+
+def current_run_id():
+    """The run id shared by every process of this run (created on first use)."""
+    if not os.environ.get("TRACE_RUN_ID"):
+        os.environ["TRACE_RUN_ID"] = new_run_id()
+    return os.environ["TRACE_RUN_ID"]
+
+def spans_path(run_id=None):
+    return os.path.join(trace_dir(), f"spans_{run_id or current_run_id()}.jsonl")
+
+def emit(record):
+    if not TRACING_ENABLED:
+        return
+    os.makedirs(trace_dir(), exist_ok=True)
+    line = json.dumps(record, ensure_ascii=False)
+    with _write_lock:
+        with open(spans_path(), "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+def emit_span(scraper, stage, duration_s, **attrs):
+    """Emit a span for a duration that was measured elsewhere (e.g. a readiness wait)."""
+    emit({
+        "run_id": current_run_id(),
+        "scraper": scraper,
+        "stage": stage,
+        "start": time.time() - duration_s,
+        "duration_ms": round(duration_s * 1000, 1),
+        "status": "ok",
+        "pid": os.getpid(),
+        **attrs
+    })
+
+@contextmanager
+def span(scraper, stage, **attrs):
+    """
+    Time a block and emit it as one span, e.g.
+        with span("foreign_transaction", "navigate", url=URL):
+            page.goto(URL)
+    Exceptions are recorded (status "error") and re-raised. The attrs dict is yielded,
+    so values only known inside the block can still be added (e.g. a row count).
+    """
+    started_at = time.time()
+    t0 = time.perf_counter()
+    status = "ok"
+    try:
+        yield attrs
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        emit({
+            "run_id": current_run_id(),
+            "scraper": scraper,
+            "stage": stage,
+            "start": started_at,
+            "duration_ms": round((time.perf_counter() - t0) * 1000, 1),
+            "status": status,
+            "pid": os.getpid(),
+            **attrs
+        })
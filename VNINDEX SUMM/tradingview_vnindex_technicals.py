@@ -1,17 +1,25 @@
 
 import os
 import sys
-import time
-from datetime import datetime, timedelta, timezone
 from playwright.sync_api import sync_playwright
+from tracing import span
+from page_waits import network_quiet, table_signature, wait_for_table_stable
+from request_filter import AD_DOMAINS, block_requests
+import report_schema
 
 # --- Configuration ---
 URL = "https://www.tradingview.com/symbols/HOSE-VNINDEX/technicals/"
+TABLE_ROWS = 'div[class*="tableWrapper"] tr, div[class*="tableWrapper"] div[class*="row-"]'
+SCRAPER = "vnindex_technicals"
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", os.path.join(os.getcwd(), "output"))
-
-def ensure_directory_exists(path):
-    if not os.path.exists(path):
-        os.makedirs(path)
+CONTEXT_OPTIONS = {
+    "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "viewport": {"width": 1280, "height": 1200}
+}
+# TradingView's own telemetry on top of the shared ad/tracker list
+REQUEST_RULES = {
+    "block_domains": AD_DOMAINS + ["telemetry.tradingview.com", "snowplow-pixel.tradingview.com"]
+}
 
 def configure_stdout():
     if sys.platform.startswith('win'):
@@ -21,10 +29,11 @@ def configure_stdout():
 
 def parse_tradingview_technicals(page):
     print("Navigating to TradingView Technicals page...")
-    page.goto(URL, timeout=90000)
-    # Wait for the main technicals containers
-    page.wait_for_selector('div[class*="tableWrapper"]', timeout=60000)
-    time.sleep(5) 
+    with span(SCRAPER, "navigate", url=URL):
+        page.goto(URL, timeout=90000)
+        # Wait for the main technicals containers
+        page.wait_for_selector('div[class*="tableWrapper"]', timeout=60000)
+    wait_for_table_stable(page, SCRAPER, TABLE_ROWS, 5, "tables after load")
     
     data = {
         "oscillators": {"headers": [], "rows": []},
@@ -41,8 +50,10 @@ def parse_tradingview_technicals(page):
             is_active = btn_1d.evaluate("el => el.getAttribute('aria-checked') === 'true' || el.classList.contains('active')")
             if not is_active:
                 print("Clicking 1D timeframe...")
-                btn_1d.click()
-                time.sleep(5) # Wait for reload
+                previous = table_signature(page, TABLE_ROWS)
+                with span(SCRAPER, "click", part="1D"):
+                    btn_1d.click()
+                wait_for_table_stable(page, SCRAPER, TABLE_ROWS, 5, "timeframe reload", previous=previous) # Wait for reload
         else:
             print("Timeframe button 1D not found.")
     except Exception as e:
@@ -53,62 +64,63 @@ def parse_tradingview_technicals(page):
         print(f"Searching for section: {title}...")
         try:
             # Scroll to end to ensure all lazy elements load
-            page.mouse.wheel(0, 500)
-            time.sleep(1)
+            with network_quiet(page, SCRAPER, 1, "scroll lazy-load"):
+                page.mouse.wheel(0, 500)
             
             # Use JS to find section accurately
-            table_info = page.evaluate(f"""(titleText) => {{
-                const findHeader = (text) => {{
-                    return Array.from(document.querySelectorAll('h2, a, span'))
-                                .find(el => el.textContent.trim() === text);
-                }};
+            with span(SCRAPER, "extract", part=title):
+                table_info = page.evaluate(f"""(titleText) => {{
+                    const findHeader = (text) => {{
+                        return Array.from(document.querySelectorAll('h2, a, span'))
+                                    .find(el => el.textContent.trim() === text);
+                    }};
                 
-                const header = findHeader(titleText);
-                if (!header) return null;
+                    const header = findHeader(titleText);
+                    if (!header) return null;
                 
-                // Find nearest container
-                let container = header.closest('div[class*="container-"], div[class*="tablesWrapper-"], div[class*="tableWrapper-"]');
-                if (!container) {{
-                    let p = header.parentElement;
-                    while (p && p !== document.body) {{
-                        if (p.querySelector('table') || p.querySelector('div[class*="row-"]')) {{
-                            container = p;
-                            break;
+                    // Find nearest container
+                    let container = header.closest('div[class*="container-"], div[class*="tablesWrapper-"], div[class*="tableWrapper-"]');
+                    if (!container) {{
+                        let p = header.parentElement;
+                        while (p && p !== document.body) {{
+                            if (p.querySelector('table') || p.querySelector('div[class*="row-"]')) {{
+                                container = p;
+                                break;
+                            }}
+                            p = p.parentElement;
                         }}
-                        p = p.parentElement;
                     }}
-                }}
                 
-                if (!container) return null;
+                    if (!container) return null;
                 
-                // Try finding rows - could be tr or div with row- class
-                const rowElements = Array.from(container.querySelectorAll('tr, div[class*="row-"]'));
-                if (rowElements.length === 0) return null;
+                    // Try finding rows - could be tr or div with row- class
+                    const rowElements = Array.from(container.querySelectorAll('tr, div[class*="row-"]'));
+                    if (rowElements.length === 0) return null;
                 
-                // Identify headers (often first row or thead)
-                let headers = [];
-                const thead = container.querySelector('thead');
-                if (thead) {{
-                    headers = Array.from(thead.querySelectorAll('th')).map(th => th.innerText.trim());
-                }} else if (rowElements.length > 0) {{
-                    // Fallback to first row items if they look like headers
-                    headers = Array.from(rowElements[0].querySelectorAll('td, div[class*="cell-"], div[class*="headCell-"]'))
-                                   .map(c => c.innerText.trim());
-                }}
+                    // Identify headers (often first row or thead)
+                    let headers = [];
+                    const thead = container.querySelector('thead');
+                    if (thead) {{
+                        headers = Array.from(thead.querySelectorAll('th')).map(th => th.innerText.trim());
+                    }} else if (rowElements.length > 0) {{
+                        // Fallback to first row items if they look like headers
+                        headers = Array.from(rowElements[0].querySelectorAll('td, div[class*="cell-"], div[class*="headCell-"]'))
+                                       .map(c => c.innerText.trim());
+                    }}
                 
-                // If headers still empty, provide defaults or try to infer
-                if (headers.length === 0) {{
-                    if (titleText === "Pivots") headers = ["Pivot", "Classic", "Fibonacci", "Camarilla", "Woodie", "DM"];
-                    else headers = ["Name", "Value", "Action"];
-                }}
+                    // If headers still empty, provide defaults or try to infer
+                    if (headers.length === 0) {{
+                        if (titleText === "Pivots") headers = ["Pivot", "Classic", "Fibonacci", "Camarilla", "Woodie", "DM"];
+                        else headers = ["Name", "Value", "Action"];
+                    }}
 
-                const rows = rowElements.map(row => {{
-                    const cells = Array.from(row.querySelectorAll('td, div[class*="cell-"]'));
-                    return cells.map(cell => cell.innerText.trim().replace(/\\n/g, ' ')).filter(txt => txt !== "");
-                }}).filter(r => r.length > 0);
+                    const rows = rowElements.map(row => {{
+                        const cells = Array.from(row.querySelectorAll('td, div[class*="cell-"]'));
+                        return cells.map(cell => cell.innerText.trim().replace(/\\n/g, ' ')).filter(txt => txt !== "");
+                    }}).filter(r => r.length > 0);
                 
-                return {{ headers, rows }};
-            }}""", title)
+                    return {{ headers, rows }};
+                }}""", title)
             
             if table_info:
                 print(f"Found {len(table_info.get('rows', []))} rows for {title}.")
@@ -127,69 +139,44 @@ def parse_tradingview_technicals(page):
         
     return data
 
-def format_technicals_report(data):
-    now = datetime.now(timezone(timedelta(hours=7)))
-    md = [f"# TradingView Technical Analysis - VNINDEX - {now.strftime('%Y-%m-%d %H:%M:%S')}\n"]
-    md.append(f"Source: {URL}\n")
-    md.append("Timeframe: 1 Day\n\n")
+def build_report(data):
+    """The report document (report_schema) for the three technicals tables."""
+    doc = report_schema.new_report(SCRAPER, "TradingView Technical Analysis - VNINDEX", URL, notes=["Timeframe: 1 Day"])
     
-    def dict_to_md_table(title, table_dict):
-        if not table_dict or not table_dict.get('headers'):
-            return f"### {title}: No Data\n\n"
-        
-        lines = [f"### {title}\n\n"]
-        headers = table_dict['headers']
-        rows = table_dict['rows']
-        
-        lines.append("| " + " | ".join(headers) + " |")
-        lines.append("| " + " | ".join(["---"] * len(headers)) + " |")
-        for row in rows:
-            row_clean = row + [""] * (max(0, len(headers) - len(row)))
-            lines.append("| " + " | ".join(row_clean) + " |")
-        lines.append("\n")
-        return "\n".join(lines)
-
-    md.append(dict_to_md_table("Oscillators", data.get('oscillators')))
-    md.append(dict_to_md_table("Moving Averages", data.get('moving_averages')))
-    md.append(dict_to_md_table("Pivots", data.get('pivots')))
+    for key, title in [("oscillators", "Oscillators"), ("moving_averages", "Moving Averages"), ("pivots", "Pivots")]:
+        table = data.get(key) or {}
+        # A section without headers was not found on the page
+        text_rows = table.get('rows', []) if table.get('headers') else []
+        report_schema.add_table(doc, title, table.get('headers', []), report_schema.parse_cells(text_rows), display_rows=text_rows)
     
-    return "".join(md)
+    return doc
+
+def run(context):
+    """Scrape the technicals page in the given BrowserContext and save the report. Returns the saved path."""
+    blocker = block_requests(context, SCRAPER, REQUEST_RULES)
+    page = context.new_page()
+    try:
+        data = parse_tradingview_technicals(page)
+        
+        if any(v and v.get('rows') for v in data.values()):
+            return report_schema.save_report(build_report(data), OUTPUT_DIR, "vnindex_technicals")
+        else:
+            print("No data extracted. Verify if page structure changed.")
+            
+    except Exception as e:
+        print(f"Fatal error: {e}")
+    finally:
+        page.close()
+        blocker.report()
+    return None
 
 def main():
     configure_stdout()
     
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=True)
-        context = browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            viewport={"width": 1280, "height": 1200}
-        )
-        page = context.new_page()
-        
         try:
-            data = parse_tradingview_technicals(page)
-            
-            if any(v and v.get('rows') for v in data.values()):
-                report_content = format_technicals_report(data)
-                
-                # Save to file
-                now = datetime.now(timezone(timedelta(hours=7)))
-                date_dir = now.strftime("%Y%m%d")
-                full_dir = os.path.join(OUTPUT_DIR, date_dir)
-                ensure_directory_exists(full_dir)
-                
-                filename = f"vnindex_technicals_{now.strftime('%H%M')}.md"
-                filepath = os.path.join(full_dir, filename)
-                
-                with open(filepath, "w", encoding="utf-8") as f:
-                    f.write(report_content)
-                
-                print(f"Saved report to {filepath}")
-            else:
-                print("No data extracted. Verify if page structure changed.")
-                
-        except Exception as e:
-            print(f"Fatal error: {e}")
+            run(browser.new_context(**CONTEXT_OPTIONS))
         finally:
             browser.close()
 
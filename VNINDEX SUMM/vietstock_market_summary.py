@@ -1,179 +1,193 @@
 import os
 import sys
-import time
-import datetime
 from playwright.sync_api import sync_playwright
+from tracing import span
+from page_waits import chart_signature, page_lanes, run_interleaved, table_signature, wait_for_highcharts, wait_for_table_stable
+from request_filter import block_requests
+from page_tables import read_rows, split_header
+from navigation import fresh_goto
+import report_schema
+
+# --- Configuration ---
+SCRAPER = "mktsumary"
+URL = "https://finance.vietstock.vn/tong-hop-cac-thi-truong"
+TABLE_ROWS = ".js-general-market-data-content tr"
+CHART_CONTAINER = "#general-markets-left"
+MENUS = ["Chứng khoán", "Hàng hóa", "Tiền tệ", "Tiền ảo"]
+# MKT_PARALLEL_MENUS=0 walks the menus one after another on a single page, as before;
+# otherwise they are spread over at most SCRAPER_PER_HOST_LIMIT pages (page_waits.MAX_PAGES)
+PARALLEL_MENUS = os.getenv("MKT_PARALLEL_MENUS", "1") != "0"
+CONTEXT_OPTIONS = {
+    "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
 
 # Fix encoding for Windows console
 sys.stdout.reconfigure(encoding='utf-8')
 
-def get_current_timestamp():
-    now = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=7)))
-    date_str = now.strftime("%Y%m%d")
-    time_str = now.strftime("%H%M")
-    return date_str, time_str, now
-
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", os.path.join(os.getcwd(), "output"))
 
-def ensure_directory(date_str):
-    full_path = os.path.join(OUTPUT_DIR, date_str)
-    if not os.path.exists(full_path):
-        os.makedirs(full_path)
-    return full_path
-
-def save_markdown(content, date_str, time_str):
-    folder = ensure_directory(date_str)
-    filename = os.path.join(folder, f"mktsumary_{time_str}.md")
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(content)
-    print(f"Saved summary to {filename}")
-
-def analyze_market_summary(url="https://finance.vietstock.vn/tong-hop-cac-thi-truong"):
-    report_content = []
-    
-    date_str, time_str, now_obj = get_current_timestamp()
-    report_content.append(f"# Market Summary - {now_obj.strftime('%Y-%m-%d %H:%M:%S')}\n")
-    report_content.append(f"Source: {url}\n\n")
-
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
-        
-        # Set User Agent
-        page.set_extra_http_headers({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        })
-
+def close_popup(page):
+    # Close popup if exists
+    try:
+        close_btn = page.locator("#btn-close-ad, .close-popup, [class*='close']").first
+        if close_btn.is_visible(timeout=3000):
+            print("Closing popup...")
+            close_btn.click()
+    except:
+        pass
+
+def menu_lane(page, url, menus):
+    """menu_section() for each (menu name, section) in turn on one page, loading it for the first only."""
+    for i, (menu_name, section) in enumerate(menus):
+        yield from menu_section(page, url, menu_name, section, load=(i == 0))
+
+def menu_section(page, url, menu_name, section, load):
+    """
+    Add one menu's part of the report to `section` (report_schema sections). This is a generator for
+    page_waits.run_interleaved(): it yields a wait wherever it has to wait for the page.
+    With load=True it first opens `url` in `page` itself.
+    """
+    if load:
         try:
-            print(f"Navigating to {url}...")
-            page.goto(url, timeout=60000, wait_until="domcontentloaded")
-            
-            # Ensure fresh data by reloading and waiting for network idle
-            print("Reloading page to ensure fresh data...")
-            page.reload(wait_until="networkidle")
-            
+            print(f"Navigating to {url} ({menu_name})...")
+            fresh_goto(page, SCRAPER, url, wait_until="commit")
+            yield lambda: page.wait_for_load_state("networkidle", timeout=60000)
             # Wait for main content
             page.wait_for_selector(".markets-section__nav-bar-item", timeout=15000)
-
-            # Close popup if exists
-            try:
-                close_btn = page.locator("#btn-close-ad, .close-popup, [class*='close']").first
-                if close_btn.is_visible(timeout=3000):
-                    print("Closing popup...")
-                    close_btn.click()
-            except:
-                pass
-
-            menus = ["Chứng khoán", "Hàng hóa", "Tiền tệ", "Tiền ảo"]
-            
-            for menu_name in menus:
-                print(f"Processing menu: {menu_name}...")
-                report_content.append(f"## {menu_name}\n")
-                
-                # 1. Click Menu
-                try:
-                    menu_item = page.locator(f".markets-section__nav-bar-item:has-text('{menu_name}')")
-                    if menu_item.is_visible():
-                        menu_item.click()
-                        time.sleep(2) # Wait for content to switch
-                    else:
-                        print(f"Menu {menu_name} not found, skipping.")
-                        report_content.append("*Menu item not found*\n")
-                        continue
-                except Exception as e:
-                    print(f"Error clicking menu {menu_name}: {e}")
-                    report_content.append(f"*Error accessing menu: {e}*\n")
-                    continue
-
-                # 2. Click Chart "1D"
-                # The chart timeframe buttons might be shared or specific. We try to find the active one or just click "1D"
-                try:
-                    # Look for 1D button within the chart area or generally
-                    btn_1d = page.locator(".general-markets__chart-timeframe:has-text('1D')").first
-                    if btn_1d.is_visible():
-                        print("Clicking 1D chart button...")
-                        btn_1d.click()
-                        time.sleep(2) # Wait for chart to update
-                    else:
-                        print("1D button not found.")
-                except Exception as e:
-                    print(f"Error clicking 1D button: {e}")
-
-                # 3. Read Chart Summary info
-                try:
-                    # Attempt to find text inside highcharts container or specific info box
-                    print("Reading chart info...")
-                    chart_info_text = "No distinct chart info found."
-                    
-                    # Strategy 1: Look for specific chart info container if exists
-                    info_box = page.locator("#general-markets-left .general-markets__chart-info").first
-                    if info_box.is_visible():
-                        chart_info_text = info_box.text_content().strip()
-                    else:
-                         # Strategy 2: Look for text nodes in highcharts
-                         # This is tricky as highcharts splits text. We grab meaningful text.
-                         container = page.locator("#general-markets-left .highcharts-container").first
-                         if container.is_visible():
-                             texts = container.locator("text").all_text_contents()
-                             # Filter out empty or very short strings (axis labels)
-                             valid_texts = [t.strip() for t in texts if len(t.strip()) > 3]
-                             chart_info_text = " | ".join(valid_texts[:10]) # Take first few lines usually containing title/price
-                    
-                    report_content.append("### Chart Summary (1D)\n")
-                    report_content.append(f"{chart_info_text}\n\n")
-                    
-                except Exception as e:
-                    print(f"Error reading chart info: {e}")
-                    report_content.append(f"*Error reading chart info: {e}*\n\n")
-
-                # 4. Table Interaction "Tất cả" & Read Data
-                try:
-                    print("Reading table data...")
-                    # Find table sub-tabs
-                    all_btn = page.locator(".general-markets__data-subTabs-item:has-text('Tất cả')").first
-                    if all_btn.is_visible():
-                         print("Clicking 'Tất cả' button...")
-                         all_btn.click()
-                         # Wait for table reload
-                         time.sleep(2) 
-                    
-                    # Read table
-                    rows = page.locator(".js-general-market-data-content tr")
-                    count = rows.count()
-                    
-                    report_content.append("### Table Data\n")
-                    
-                    if count > 0:
-                        report_content.append("| Row | Content |\n")
-                        report_content.append("| --- | --- |\n")
-                        
-                        # Limit rows to avoid huge files if necessary, but request said "toàn bộ"
-                        for i in range(count):
-                            row_text = rows.nth(i).inner_text().replace("\n", " | ").strip()
-                            # Clean up multiple spaces
-                            import re
-                            row_text = re.sub(r'\s+', ' ', row_text)
-                            report_content.append(f"| {i+1} | {row_text} |\n")
-                    else:
-                        report_content.append("*No data rows found.*\n")
-                    
-                    report_content.append("\n")
-
-                except Exception as e:
-                    print(f"Error reading table: {e}")
-                    report_content.append(f"*Error reading table: {e}*\n\n")
-                
-                report_content.append("---\n\n")
-
         except Exception as e:
-            print(f"Global error: {e}")
-            report_content.append(f"\n# Error Occurred\n{e}\n")
-        finally:
-            browser.close()
-
-    # Save to file
-    full_content = "".join(report_content)
-    save_markdown(full_content, date_str, time_str)
+            print(f"Error loading page for {menu_name}: {e}")
+            report_schema.add_heading(section, menu_name)
+            report_schema.add_text(section, f"*Error loading page: {e}*")
+            return
+        close_popup(page)
+
+    print(f"Processing menu: {menu_name}...")
+    report_schema.add_heading(section, menu_name)
+    
+    # 1. Click Menu
+    try:
+        menu_item = page.locator(f".markets-section__nav-bar-item:has-text('{menu_name}')")
+        if menu_item.is_visible():
+            previous = table_signature(page, TABLE_ROWS)
+            with span(SCRAPER, "click", part=menu_name):
+                menu_item.click()
+            yield lambda: wait_for_table_stable(page, SCRAPER, TABLE_ROWS, 2, "menu switch", previous=previous) # Wait for content to switch
+        else:
+            print(f"Menu {menu_name} not found, skipping.")
+            report_schema.add_text(section, "*Menu item not found*")
+            return
+    except Exception as e:
+        print(f"Error clicking menu {menu_name}: {e}")
+        report_schema.add_text(section, f"*Error accessing menu: {e}*")
+        return
+
+    # 2. Click Chart "1D"
+    # The chart timeframe buttons might be shared or specific. We try to find the active one or just click "1D"
+    try:
+        # Look for 1D button within the chart area or generally
+        btn_1d = page.locator(".general-markets__chart-timeframe:has-text('1D')").first
+        if btn_1d.is_visible():
+            print("Clicking 1D chart button...")
+            previous = chart_signature(page, CHART_CONTAINER)
+            with span(SCRAPER, "click", part="1D"):
+                btn_1d.click()
+            yield lambda: wait_for_highcharts(page, SCRAPER, 2, "chart 1D update", container=CHART_CONTAINER, previous=previous) # Wait for chart to update
+        else:
+            print("1D button not found.")
+    except Exception as e:
+        print(f"Error clicking 1D button: {e}")
+
+    # 3. Read Chart Summary info
+    try:
+        # Attempt to find text inside highcharts container or specific info box
+        print("Reading chart info...")
+        chart_info_text = "No distinct chart info found."
+        
+        # Strategy 1: Look for specific chart info container if exists
+        info_box = page.locator("#general-markets-left .general-markets__chart-info").first
+        if info_box.is_visible():
+            chart_info_text = info_box.text_content().strip()
+        else:
+             # Strategy 2: Look for text nodes in highcharts
+             # This is tricky as highcharts splits text. We grab meaningful text.
+             container = page.locator("#general-markets-left .highcharts-container").first
+             if container.is_visible():
+                 texts = container.locator("text").all_text_contents()
+                 # Filter out empty or very short strings (axis labels)
+                 valid_texts = [t.strip() for t in texts if len(t.strip()) > 3]
+                 chart_info_text = " | ".join(valid_texts[:10]) # Take first few lines usually containing title/price
+        
+        report_schema.add_text(section, chart_info_text, title="Chart Summary (1D)")
+        
+    except Exception as e:
+        print(f"Error reading chart info: {e}")
+        report_schema.add_text(section, f"*Error reading chart info: {e}*")
+
+    # 4. Table Interaction "Tất cả" & Read Data
+    try:
+        print("Reading table data...")
+        # Find table sub-tabs
+        all_btn = page.locator(".general-markets__data-subTabs-item:has-text('Tất cả')").first
+        if all_btn.is_visible():
+             print("Clicking 'Tất cả' button...")
+             previous = table_signature(page, TABLE_ROWS)
+             with span(SCRAPER, "click", part="Tất cả"):
+                 all_btn.click()
+             # Wait for table reload
+             yield lambda: wait_for_table_stable(page, SCRAPER, TABLE_ROWS, 2, "table reload", previous=previous)
+        
+        # Read table
+        with span(SCRAPER, "extract", part=f"{menu_name} table") as attrs:
+            rows = read_rows(page, TABLE_ROWS)
+            attrs["rows"] = len(rows)
+        
+        # All rows are kept, the request said "toàn bộ"
+        columns, body = split_header(rows)
+        report_schema.add_table(section, "Table Data", columns, report_schema.parse_cells(body), display_rows=body)
+
+    except Exception as e:
+        print(f"Error reading table: {e}")
+        report_schema.add_text(section, f"*Error reading table: {e}*")
+
+def analyze_market_summary(url=URL, context=None):
+    if context is None:
+        with sync_playwright() as p:
+            browser = p.chromium.launch(headless=True)
+            try:
+                return analyze_market_summary(url, browser.new_context(**CONTEXT_OPTIONS))
+            finally:
+                browser.close()
+
+    doc = report_schema.new_report(SCRAPER, "Market Summary", url)
+
+    blocker = block_requests(context, SCRAPER)
+    pages = []
+
+    try:
+        # One section per menu, joined in menu order whatever order they finish in
+        sections = [{"sections": []} for _ in MENUS]
+        menus = list(zip(MENUS, sections))
+        # A few pages driven at once, each walking its share of the menus
+        lanes = page_lanes(menus) if PARALLEL_MENUS else [menus]
+        pages = [context.new_page() for _ in lanes]
+        run_interleaved([menu_lane(page, url, lane) for page, lane in zip(pages, lanes)])
+        for section in sections:
+            doc["sections"].extend(section["sections"])
+
+    except Exception as e:
+        print(f"Global error: {e}")
+        report_schema.add_text(doc, str(e), title="Error Occurred", level=1)
+    finally:
+        for page in pages:
+            page.close()
+        blocker.report()
+
+    return report_schema.save_report(doc, OUTPUT_DIR, "mktsumary")
+
+def run(context):
+    """Importable entry point for the shared-browser runner. Returns the saved path."""
+    return analyze_market_summary(context=context)
 
 if __name__ == "__main__":
     analyze_market_summary()
+
@@ -1,18 +1,23 @@
 
 import os
 import sys
-import time
 import re
-from datetime import datetime, timedelta, timezone
 from playwright.sync_api import sync_playwright
+from tracing import span
+from page_waits import wait_for_highcharts
+from request_filter import block_requests
+from xhr_capture import CAPTURE_ENABLED, JsonCapture, top_buy_sell
+from navigation import fresh_goto
+import report_schema
 
 # --- Configuration ---
 URL = "https://finance.vietstock.vn/giao-dich-tu-doanh"
+SCRAPER = "proprietary_trading"
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", os.path.join(os.getcwd(), "output"))
-
-def ensure_directory_exists(path):
-    if not os.path.exists(path):
-        os.makedirs(path)
+CONTEXT_OPTIONS = {
+    "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "viewport": {"width": 1280, "height": 720}
+}
 
 def configure_stdout():
     if sys.platform.startswith('win'):
@@ -22,13 +27,15 @@ def configure_stdout():
 
 def parse_prop_trading_data(page):
     print("Navigating to Proprietary Trading page...")
-    page.goto(URL, timeout=60000)
-    page.wait_for_load_state("networkidle")
-    
-    # Force reload
-    print("Reloading page...")
-    page.reload(wait_until="domcontentloaded")
-    time.sleep(5) 
+    # Listen before navigating so the payloads behind the Top Buy/Sell charts are captured
+    capture = JsonCapture(page, SCRAPER) if CAPTURE_ENABLED else None
+    fresh_goto(page, SCRAPER, URL)
+    top_lists = None
+    if capture:
+        top_lists = capture.wait_for(top_buy_sell)
+        capture.close()
+    # Summary chart, plus Top Sell + Top Buy when those have to be read from the SVG
+    wait_for_highcharts(page, SCRAPER, 5, "charts render", min_charts=1 if top_lists else 3, timeout=30)
     
     data = {
         "summary": {},
@@ -40,23 +47,24 @@ def parse_prop_trading_data(page):
     # Highcharts.charts[0]
     print("Extracting Daily Summary...")
     try:
-        summary_data = page.evaluate("""() => {
-            const chart = Highcharts.charts[0];
-            if (!chart) return null;
+        with span(SCRAPER, "extract", part="summary"):
+            summary_data = page.evaluate("""() => {
+                const chart = Highcharts.charts[0];
+                if (!chart) return null;
             
-            const lastIdx = chart.series[0].options.data.length - 1;
-            if (lastIdx < 0) return null;
+                const lastIdx = chart.series[0].options.data.length - 1;
+                if (lastIdx < 0) return null;
             
-            const result = {};
-            chart.series.forEach(s => {
-                const point = s.options.data[lastIdx];
-                result[s.name] = {
-                    value: point.y,
-                    date: point.custom ? point.custom.customTradingDate : 'N/A'
-                };
-            });
-            return result;
-        }""")
+                const result = {};
+                chart.series.forEach(s => {
+                    const point = s.options.data[lastIdx];
+                    result[s.name] = {
+                        value: point.y,
+                        date: point.custom ? point.custom.customTradingDate : 'N/A'
+                    };
+                });
+                return result;
+            }""")
         
         if summary_data:
             data['summary'] = summary_data
@@ -68,6 +76,11 @@ def parse_prop_trading_data(page):
     except Exception as e:
         print(f"Error extracting summary: {e}")
 
+    if top_lists:
+        data['top_buy'], data['top_sell'] = top_lists
+        print(f"Top Stocks from JSON: {len(data['top_buy'])} buy, {len(data['top_sell'])} sell.")
+        return data
+
     # 2. Parse Right Charts (Top Net Buy / Top Net Sell)
     # Survey findings:
     # Top Sell = Index 1
@@ -77,14 +90,15 @@ def parse_prop_trading_data(page):
     print("Extracting Top Stocks...")
     
     def parse_chart_texts(container_index):
-        return page.evaluate(f"""() => {{
-            const charts = document.querySelectorAll('.highcharts-container');
-            if (charts.length <= {container_index}) return null;
+        with span(SCRAPER, "extract", part=f"chart {container_index}"):
+            return page.evaluate(f"""() => {{
+                const charts = document.querySelectorAll('.highcharts-container');
+                if (charts.length <= {container_index}) return null;
             
-            const container = charts[{container_index}];
-            const texts = Array.from(container.querySelectorAll('text')).map(t => t.textContent.trim()).filter(t => t.length > 0);
-            return texts;
-        }}""")
+                const container = charts[{container_index}];
+                const texts = Array.from(container.querySelectorAll('text')).map(t => t.textContent.trim()).filter(t => t.length > 0);
+                return texts;
+            }}""")
 
     def pars_stock_list_values_first(raw_texts):
         # Pattern: All Values First, then All Codes.
@@ -130,77 +144,59 @@ def parse_prop_trading_data(page):
         
     return data
 
-def format_report(data):
-    now = datetime.now(timezone(timedelta(hours=7)))
-    md = [f"# Proprietary Trading (Tu Doanh) - {now.strftime('%Y-%m-%d %H:%M:%S')}\n"]
-    md.append(f"Source: {URL}\n\n")
+def build_report(data):
+    """The report document (report_schema) for the scraped data."""
+    doc = report_schema.new_report(SCRAPER, "Proprietary Trading (Tu Doanh)", URL)
     
     # Summary Table
     if data.get('summary'):
-        md.append("### Daily Summary\n\n")
+        # Extract date
         date_val = list(data['summary'].values())[0]['date']
-        md.append(f"**Date:** {date_val}\n\n")
-        
-        md.append("| Category | Value (Billion VND) |\n")
-        md.append("| --- | --- |\n")
+        doc['trading_date'] = report_schema.iso_date(date_val)
         
         order = ["Giá trị mua", "Giá trị bán", "Giá trị mua ròng"]
-        for k in order:
-            item = data['summary'].get(k)
-            if item:
-                md.append(f"| {k} | {item['value']:.2f} |\n")
-        md.append("\n")
+        rows = [[k, data['summary'][k]['value']] for k in order if data['summary'].get(k)]
+        report_schema.add_table(doc, "Daily Summary", ["Category", "Value (Billion VND)"], rows,
+                                note=f"**Date:** {date_val}", number_format="{:.2f}")
         
     # Top Buy
-    md.append("### Top Net Buy (Top Mua Ròng)\n\n")
-    md.append("| Stock Code | Value (Billion VND) |\n")
-    md.append("| --- | --- |\n")
-    for item in data['top_buy']:
-        md.append(f"| {item['code']} | {item['value']:.2f} |\n")
-    md.append("\n")
+    report_schema.add_table(doc, "Top Net Buy (Top Mua Ròng)", ["Stock Code", "Value (Billion VND)"],
+                            [[item['code'], item['value']] for item in data['top_buy']], number_format="{:.2f}")
 
     # Top Sell
-    md.append("### Top Net Sell (Top Bán Ròng)\n\n")
-    md.append("| Stock Code | Value (Billion VND) |\n")
-    md.append("| --- | --- |\n")
-    for item in data['top_sell']:
-        md.append(f"| {item['code']} | {item['value']:.2f} |\n")
-    md.append("\n")
+    report_schema.add_table(doc, "Top Net Sell (Top Bán Ròng)", ["Stock Code", "Value (Billion VND)"],
+                            [[item['code'], item['value']] for item in data['top_sell']], number_format="{:.2f}")
     
-    return "".join(md)
+    return doc
+
+def save_report(data):
+    """Save the JSON document and the Markdown rendered from it. Returns the Markdown path."""
+    return report_schema.save_report(build_report(data), OUTPUT_DIR, "proprietary_trading")
+
+def run(context):
+    """Scrape the page in the given BrowserContext and save the report. Returns the saved path."""
+    blocker = block_requests(context, SCRAPER)
+    page = context.new_page()
+    try:
+        data = parse_prop_trading_data(page)
+        
+        if data:
+            return save_report(data)
+            
+    except Exception as e:
+        print(f"Fatal error: {e}")
+    finally:
+        page.close()
+        blocker.report()
+    return None
 
 def main():
     configure_stdout()
     
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=True)
-        page = browser.new_page(
-             user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-             viewport={"width": 1280, "height": 720}
-        )
-        
         try:
-            data = parse_prop_trading_data(page)
-            
-            if data:
-                report_content = format_report(data)
-                
-                # Save to file
-                now = datetime.now(timezone(timedelta(hours=7)))
-                date_dir = now.strftime("%Y%m%d")
-                full_dir = os.path.join(OUTPUT_DIR, date_dir)
-                ensure_directory_exists(full_dir)
-                
-                filename = f"proprietary_trading_{now.strftime('%H%M')}.md"
-                filepath = os.path.join(full_dir, filename)
-                
-                with open(filepath, "w", encoding="utf-8") as f:
-                    f.write(report_content)
-                
-                print(f"Saved report to {filepath}")
-                
-        except Exception as e:
-            print(f"Fatal error: {e}")
+            run(browser.new_context(**CONTEXT_OPTIONS))
         finally:
             browser.close()
 
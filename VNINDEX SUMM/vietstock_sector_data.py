@@ -1,17 +1,31 @@
 
 import os
 import sys
-import time
-import datetime
 from playwright.sync_api import sync_playwright
+from tracing import span
+from page_waits import NetworkWatch, page_lanes, run_interleaved, table_signature, wait_for_table_stable
+from request_filter import block_requests
+from page_tables import read_table
+from navigation import fresh_goto
+import report_schema
 
 # --- Configuration ---
 URL = "https://finance.vietstock.vn/du-lieu-nganh.htm#sector-performance"
+TABLE_ROWS = "#table-performance-wrapper tbody tr"
+TABS = {"performance": "Hiệu suất ngành", "cash_flow": "Dòng tiền ngành"}
+# Sector levels to read in both tabs (1 = Ngành cấp 1 ... 4 = Ngành cấp 4)
+SECTOR_LEVELS = [int(level) for level in os.getenv("SECTOR_LEVELS", "1,2,3,4").split(",") if level.strip()]
+SCRAPER = "sector_data"
+# True when the tab named `name` is the one already shown
+TAB_ACTIVE_JS = """(name) => {
+    const tab = Array.from(document.querySelectorAll('a.option-tab')).find(el => el.textContent.trim() === name);
+    return !!tab && (tab.classList.contains('active') || (!!tab.parentElement && tab.parentElement.classList.contains('active')));
+}"""
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", os.path.join(os.getcwd(), "output"))
-
-def ensure_directory_exists(path):
-    if not os.path.exists(path):
-        os.makedirs(path)
+CONTEXT_OPTIONS = {
+    "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "viewport": {"width": 1280, "height": 720}
+}
 
 def configure_stdout():
     if sys.platform.startswith('win'):
@@ -19,181 +33,152 @@ def configure_stdout():
         sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
         sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
-def parse_sector_data(page):
-    print("Navigating to Sector Data page...")
-    page.goto(URL, timeout=90000)
-    page.wait_for_load_state("networkidle", timeout=60000)
-    
-    # Reload to ensure clean state
-    print("Reloading page...")
-    page.reload(wait_until="domcontentloaded")
-    time.sleep(5)
-    
-    data = {
-        "performance": [],
-        "cash_flow": []
-    }
-    
-    # --- Helper to select Level 1 Sector ---
-    def select_sector_level_1():
-        print("Selecting 'Ngành cấp 1'...")
-        try:
-            # Dropdown is usually the second one
-            selects = page.locator("select.form-control").all()
-            if len(selects) >= 2:
-                selects[1].select_option(value="1")
-                selects[1].dispatch_event("change")
-                time.sleep(3)
-            else:
-                # Try finding by looking at the parent container of tabs if possible, or fallback
-                # Subagent said "select.form-control" (index 0 or 1).
-                # Let's try locating explicitly
-                # Based on subagent trace: document.querySelector('select.form-control')
-                page.select_option("select.form-control", value="1")
-        except Exception as e:
-            print(f"Error selecting sector level: {e}")
+def select_sector_level(page, level):
+    """
+    Switch the table to sector `level`. A generator for page_waits.run_interleaved(): it
+    yields the wait for the level request and then the wait for the table to change.
+    Nothing to wait for when `level` is already the one shown.
+    """
+    print(f"Selecting 'Ngành cấp {level}'...")
+    try:
+        # Dropdown is usually the second one
+        selects = page.locator("select.form-control").all()
+        level_select = selects[1] if len(selects) >= 2 else page.locator("select.form-control").first
+        if level_select.input_value() == str(level):
+            print(f"'Ngành cấp {level}' is already shown")
+            return
+        previous = table_signature(page, TABLE_ROWS)
+        if len(selects) >= 2:
+            watch = NetworkWatch(page, SCRAPER, 3, "sector level change")
+            try:
+                with span(SCRAPER, "select", part=f"level {level}"):
+                    selects[1].select_option(value=str(level))
+                    selects[1].dispatch_event("change")
+                yield watch.wait
+            finally:
+                watch.stop()
+        else:
+            # Try finding by looking at the parent container of tabs if possible, or fallback
+            # Subagent said "select.form-control" (index 0 or 1).
+            # Let's try locating explicitly
+            # Based on subagent trace: document.querySelector('select.form-control')
+            page.select_option("select.form-control", value=str(level))
+        yield lambda: wait_for_table_stable(page, SCRAPER, TABLE_ROWS, 2, "level table update", previous=previous) # Wait for table update
+    except Exception as e:
+        print(f"Error selecting sector level: {e}")
 
-    # --- Helper to extract table ---
-    def extract_table(tab_name):
-        print(f"Extracting table for {tab_name}...")
-        try:
-            # Subagent identified unique wrapper: #table-performance-wrapper
-            container = page.locator("#table-performance-wrapper .table-responsive")
+def extract_table(page, tab_name):
+    print(f"Extracting table for {tab_name}...")
+    try:
+        # Subagent identified unique wrapper: #table-performance-wrapper
+        with span(SCRAPER, "extract", part=tab_name) as attrs:
+            container = page.locator("#table-performance-wrapper .table-responsive").first
             container.wait_for(state="visible", timeout=10000)
             
-            # Headers
-            headers = container.locator("thead th").all_text_contents()
-            headers = [h.strip().replace('\n', ' ') for h in headers if h.strip()]
-            
-            # Rows
-            rows_data = []
-            rows = container.locator("tbody tr").all()
-            
-            for row in rows:
-                cols = row.locator("td").all_text_contents()
-                cols = [c.strip() for c in cols]
-                if cols:
-                    rows_data.append(cols)
-            
-            return {"headers": headers, "rows": rows_data}
-            
-        except Exception as e:
-            print(f"Error extracting table: {e}")
-            return None
+            # Headers and rows in one call
+            table = read_table(container)
+            attrs["rows"] = len(table["rows"])
+        
+        return table
+        
+    except Exception as e:
+        print(f"Error extracting table: {e}")
+        return None
 
-    # --- Part 1: Sector Performance (Default Tab) ---
-    print("Processing 'Hiệu suất ngành'...")
+def tab_tables(page, tab_name, tables):
+    """
+    Load the page, switch to `tab_name` and read its table at every sector level into
+    tables[level]. A generator for page_waits.run_interleaved(): it yields at every wait.
+    """
     try:
-        # Click Tab explicitly
-        # Using selector from subagent: .option-tab:nth-of-type(1) might be fragile if multiple sets.
-        # Use text match.
-        page.evaluate("Array.from(document.querySelectorAll('a.option-tab')).find(el => el.textContent.trim() === 'Hiệu suất ngành').click()")
-        time.sleep(3) # Wait for load
-        select_sector_level_1()
-        time.sleep(2) # Wait for table update
-        perf_data = extract_table("Performance")
-        if perf_data:
-            data['performance'] = perf_data
+        print(f"Navigating to Sector Data page ({tab_name})...")
+        fresh_goto(page, SCRAPER, URL, wait_until="commit", timeout=90000)
+        yield lambda: page.wait_for_load_state("domcontentloaded", timeout=90000)
+        yield lambda: wait_for_table_stable(page, SCRAPER, TABLE_ROWS, 5, "table after load", timeout=60)
     except Exception as e:
-        print(f"Error processing Performance tab: {e}")
+        print(f"Error loading Sector Data page for {tab_name}: {e}")
+        return
 
-    # --- Part 2: Sector Cash Flow ---
-    print("Processing 'Dòng tiền ngành'...")
+    print(f"Processing '{tab_name}'...")
     try:
-        # Click Tab
-        page.evaluate("Array.from(document.querySelectorAll('a.option-tab')).find(el => el.textContent.trim() === 'Dòng tiền ngành').click()")
-        time.sleep(3) # Wait for tab switch
-        
-        # Ensure Sector Level is still 1 (Context might change)
-        select_sector_level_1()
-        
-        cf_data = extract_table("Cash Flow")
-        if cf_data:
-            data['cash_flow'] = cf_data
-            
+        # The performance tab is usually already active: clicking it would not change the table
+        if page.evaluate(TAB_ACTIVE_JS, tab_name):
+            print(f"'{tab_name}' is already active")
+        else:
+            # Click Tab explicitly, by text
+            previous = table_signature(page, TABLE_ROWS)
+            with span(SCRAPER, "click", part=tab_name):
+                page.evaluate("(name) => Array.from(document.querySelectorAll('a.option-tab')).find(el => el.textContent.trim() === name).click()", tab_name)
+            yield lambda: wait_for_table_stable(page, SCRAPER, TABLE_ROWS, 3, "tab switch", previous=previous)
     except Exception as e:
-        print(f"Error processing Cash Flow tab: {e}")
-        
+        print(f"Error processing {tab_name} tab: {e}")
+        return
+
+    # A level change is one background request on the already loaded page
+    for level in SECTOR_LEVELS:
+        yield from select_sector_level(page, level)
+        table = extract_table(page, f"{tab_name} - level {level}")
+        if table:
+            tables[level] = table
+
+def tab_lane(page, tabs, data):
+    """tab_tables() for each (key, tab name) in turn on one page."""
+    for key, tab_name in tabs:
+        yield from tab_tables(page, tab_name, data[key])
+
+def parse_sector_data(context):
+    """
+    Both tabs at every level in SECTOR_LEVELS, on up to one page per tab (at most
+    SCRAPER_PER_HOST_LIMIT pages, see page_waits.MAX_PAGES), walked at the same time.
+    Returns {"performance": {level: table}, "cash_flow": {level: table}}.
+    """
+    data = {key: {} for key in TABS}
+    lanes = page_lanes(list(TABS.items()))
+    pages = [context.new_page() for _ in lanes]
+    try:
+        run_interleaved([tab_lane(page, lane, data) for page, lane in zip(pages, lanes)])
+    finally:
+        for page in pages:
+            page.close()
     return data
 
-def format_report(data):
-    now = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=7)))
-    md = [f"# Sector Data (Dữ liệu Ngành cấp 1) - {now.strftime('%Y-%m-%d %H:%M:%S')}\n"]
-    md.append(f"Source: {URL}\n\n")
+def build_report(data):
+    """The report document (report_schema): both tabs at every level, level 1 first."""
+    levels = ", ".join(str(level) for level in SECTOR_LEVELS)
+    doc = report_schema.new_report(SCRAPER, f"Sector Data (Dữ liệu Ngành cấp {levels})", URL)
     
-    # 1. Performance Table
-    if data.get('performance'):
-        headers = data['performance']['headers']
-        rows = data['performance']['rows']
-        
-        md.append("### Hiệu suất ngành\n\n")
-        
-        # Markdown Table
-        header_row = "| " + " | ".join(headers) + " |"
-        sep_row = "| " + " | ".join(["---"] * len(headers)) + " |"
-        md.append(header_row + "\n")
-        md.append(sep_row + "\n")
+    # Level 1 keeps the plain section titles; deeper levels are named
+    for level in SECTOR_LEVELS:
+        for key, tab_name in TABS.items():
+            title = tab_name if level == 1 else f"{tab_name} - Ngành cấp {level}"
+            table = data.get(key, {}).get(level) or {"headers": [], "rows": []}
+            report_schema.add_table(doc, title, table['headers'], report_schema.parse_cells(table['rows']),
+                                    display_rows=table['rows'])
         
-        for row in rows:
-            # Handle row length mismatch if any (though usually fine)
-            # Just join
-            md.append("| " + " | ".join(row) + " |\n")
-        md.append("\n")
-    else:
-        md.append("### Hiệu suất ngành: No Data\n\n")
+    return doc
 
-    # 2. Cash Flow Table
-    if data.get('cash_flow'):
-        headers = data['cash_flow']['headers']
-        rows = data['cash_flow']['rows']
-        
-        md.append("### Dòng tiền ngành\n\n")
-        
-        header_row = "| " + " | ".join(headers) + " |"
-        sep_row = "| " + " | ".join(["---"] * len(headers)) + " |"
-        md.append(header_row + "\n")
-        md.append(sep_row + "\n")
-        
-        for row in rows:
-            md.append("| " + " | ".join(row) + " |\n")
-        md.append("\n")
-    else:
-        md.append("### Dòng tiền ngành: No Data\n\n")
+def run(context):
+    """Scrape the page in the given BrowserContext and save the report. Returns the saved path."""
+    blocker = block_requests(context, SCRAPER)
+    try:
+        data = parse_sector_data(context)
         
-    return "".join(md)
+        if data:
+            return report_schema.save_report(build_report(data), OUTPUT_DIR, "sector_data")
+            
+    except Exception as e:
+        print(f"Fatal error: {e}")
+    finally:
+        blocker.report()
+    return None
 
 def main():
     configure_stdout()
     
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=True)
-        page = browser.new_page(
-             user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-             viewport={"width": 1280, "height": 720}
-        )
-        
         try:
-            data = parse_sector_data(page)
-            
-            if data:
-                report_content = format_report(data)
-                
-                # Save to file
-                now = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=7)))
-                date_dir = now.strftime("%Y%m%d")
-                full_dir = os.path.join(OUTPUT_DIR, date_dir)
-                ensure_directory_exists(full_dir)
-                
-                filename = f"sector_data_{now.strftime('%H%M')}.md"
-                filepath = os.path.join(full_dir, filename)
-                
-                with open(filepath, "w", encoding="utf-8") as f:
-                    f.write(report_content)
-                
-                print(f"Saved report to {filepath}")
-                
-        except Exception as e:
-            print(f"Fatal error: {e}")
+            run(browser.new_context(**CONTEXT_OPTIONS))
         finally:
             browser.close()
 
@@ -1,35 +1,76 @@
 import os
 import sys
-import time
-import datetime
 import re
 from playwright.sync_api import sync_playwright
+from tracing import span
+from page_waits import wait_for_condition, wait_for_highcharts
+from request_filter import block_requests
+from navigation import fresh_goto
+import report_schema
+
+# --- Configuration ---
+SCRAPER = "top_influence"
+URL = "https://finance.vietstock.vn/"
+CONTEXT_OPTIONS = {
+    "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
+# Charts to scrape
+CHARTS = [
+    {"id": "top-influence-1", "title": "VN-INDEX"},
+    {"id": "top-influence-4", "title": "VN30-INDEX"},
+    {"id": "top-influence-2", "title": "HNX-INDEX"}
+]
 
 # Fix encoding for Windows console
 sys.stdout.reconfigure(encoding='utf-8')
 
-def get_current_timestamp():
-    now = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=7)))
-    date_str = now.strftime("%Y%m%d")
-    time_str = now.strftime("%H%M")
-    return date_str, time_str, now
-
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", os.path.join(os.getcwd(), "output"))
 
-def ensure_directory(date_str):
-    full_path = os.path.join(OUTPUT_DIR, date_str)
-    if not os.path.exists(full_path):
-        os.makedirs(full_path)
-    return full_path
+# Points of the Highcharts chart rendered inside each container id, as {id: [{code, point}]}
+SERIES_JS = """(ids) => {
+    if (!window.Highcharts) return null;
+    const result = {};
+    ids.forEach(id => {
+        const chart = Highcharts.charts.find(c => c && c.renderTo && c.renderTo.closest('#' + id));
+        if (!chart) return;
+        result[id] = [];
+        chart.series.forEach(s => {
+            (s.points && s.points.length ? s.points : s.data || []).forEach(p => {
+                result[id].push({code: p.name || p.category, point: p.y});
+            });
+        });
+    });
+    return result;
+}"""
 
-def save_markdown(content, date_str, time_str):
-    folder = ensure_directory(date_str)
-    filename = os.path.join(folder, f"top_influence_{time_str}.md")
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(content)
-    print(f"Saved summary to {filename}")
+def read_series_data(page, chart_ids):
+    """
+    Read gainers/losers for every chart straight from its Highcharts series in one evaluate.
+    Returns {chart_id: {"gainers", "losers"}} for the charts whose points were found.
+    """
+    raw = page.evaluate(SERIES_JS, chart_ids) or {}
+    stock_pattern = re.compile(r'^[A-Z0-9]{3}$')
+
+    result = {}
+    for chart_id, points in raw.items():
+        seen = set()
+        valid = []
+        for p in points:
+            code, value = p.get("code"), p.get("point")
+            if not isinstance(code, str) or not stock_pattern.match(code) or not isinstance(value, (int, float)) or code in seen:
+                continue
+            seen.add(code)
+            valid.append({"code": code, "point": float(value)})
+        if not valid:
+            continue
+        result[chart_id] = {
+            "gainers": sorted((p for p in valid if p["point"] >= 0), key=lambda p: p["point"], reverse=True),
+            "losers": sorted((p for p in valid if p["point"] < 0), key=lambda p: p["point"])
+        }
+    return result
 
 def parse_chart_data(page, chart_id, chart_title):
+    """DOM fallback: pair data-label texts by position when the chart's series cannot be read."""
     print(f"Processing {chart_title} ({chart_id})...")
     
     chart_data = {
@@ -186,114 +227,91 @@ def parse_chart_data(page, chart_id, chart_title):
         
     return chart_data
 
-def format_table(data, title):
-    md = []
-    md.append(f"### {title}\n\n")
-    
-    if not data or (not data['gainers'] and not data['losers']):
-        md.append("*No data found.*\n\n")
-        return "".join(md)
+def add_chart_table(doc, data, title):
+    """One table per chart: gainers and losers side by side, blank cells where one list is shorter."""
+    gainers, losers = data['gainers'], data['losers']
+    rows = []
+    for i in range(max(len(gainers), len(losers))):
+        g = gainers[i] if i < len(gainers) else {"code": None, "point": None}
+        l = losers[i] if i < len(losers) else {"code": None, "point": None}
+        rows.append([g['code'], g['point'], l['code'], l['point']])
+    report_schema.add_table(doc, title, ["Top Gainers", "Points", "Top Losers", "Points"], rows,
+                            number_format="{:.2f}", key_columns=[0, 2])
 
-    # Top Gainers Table
-    md.append("#### Top Gainers\n")
-    md.append("| Stock Code | Contribution |\n")
-    md.append("| --- | --- |\n")
-    for item in data['gainers']:
-        md.append(f"| {item['code']} | {item['point']:.2f} |\n")
-    md.append("\n")
-
-    # Top Losers Table
-    md.append("#### Top Losers\n")
-    md.append("| Stock Code | Contribution |\n")
-    md.append("| --- | --- |\n")
-    for item in data['losers']:
-        md.append(f"| {item['code']} | {item['point']:.2f} |\n")
-    
-    md.append("\n")
-    return "".join(md)
+def analyze_top_influence(url=URL, context=None):
+    if context is None:
+        with sync_playwright() as p:
+            browser = p.chromium.launch(headless=True)
+            try:
+                return analyze_top_influence(url, browser.new_context(**CONTEXT_OPTIONS))
+            finally:
+                browser.close()
 
-def format_table(data, title):
-    md = []
-    md.append(f"### {title}\n\n")
-    
-    if not data or (not data['gainers'] and not data['losers']):
-        md.append("*No data found.*\n\n")
-        return "".join(md)
+    doc = report_schema.new_report(SCRAPER, "Top Influence Stocks", f"{url}#top-influence")
 
-    md.append("| Top Gainers | Points | Top Losers | Points |\n")
-    md.append("| --- | --- | --- | --- |\n")
-    
-    max_rows = max(len(data['gainers']), len(data['losers']))
-    
-    for i in range(max_rows):
-        g_code = data['gainers'][i]['code'] if i < len(data['gainers']) else ""
-        g_point = f"{data['gainers'][i]['point']:.2f}" if i < len(data['gainers']) else ""
-        
-        l_code = data['losers'][i]['code'] if i < len(data['losers']) else ""
-        l_point = f"{data['losers'][i]['point']:.2f}" if i < len(data['losers']) else ""
-        
-        md.append(f"| {g_code} | {g_point} | {l_code} | {l_point} |\n")
-    
-    md.append("\n")
-    return "".join(md)
+    blocker = block_requests(context, SCRAPER)
+    page = context.new_page()
 
-def analyze_top_influence(url="https://finance.vietstock.vn/"):
-    report_content = []
-    
-    date_str, time_str, now_obj = get_current_timestamp()
-    report_content.append(f"# Top Influence Stocks - {now_obj.strftime('%Y-%m-%d %H:%M:%S')}\n")
-    report_content.append(f"Source: {url}#top-influence\n\n")
-
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
+    try:
+        print(f"Navigating to {url}...")
+        fresh_goto(page, SCRAPER, url)
+        wait_for_highcharts(page, SCRAPER, 5, "charts after load", timeout=30)
         
-        # Set User Agent
-        page.set_extra_http_headers({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        })
+        chart_ids = [c["id"] for c in CHARTS]
+        # Scroll to Top Influence section to ensure charts are rendered
+        print("Scrolling to #top-influence...")
+        try:
+            # Need to wait for element to be present
+            page.wait_for_selector("#top-influence", timeout=30000)
+            page.locator("#top-influence").scroll_into_view_if_needed()
+            # Every chart has its series populated (data labels are only needed by the DOM fallback)
+            wait_for_condition(page, SCRAPER, """(ids) => window.Highcharts && ids.every(id =>
+                Highcharts.charts.some(c => c && c.renderTo && c.renderTo.closest('#' + id) &&
+                    c.series.some(s => (s.options.data || []).length)))""",
+                3, "chart series", arg=chart_ids)
+        except Exception as e:
+            print(f"Could not scroll to element: {e}")
 
         try:
-            print(f"Navigating to {url}...")
-            page.goto(url, timeout=60000, wait_until="domcontentloaded")
-            
-            print("Reloading page to ensure fresh data...")
-            page.reload(wait_until="domcontentloaded")
-            time.sleep(5)
-            
-            # Scroll to Top Influence section to ensure charts are rendered
-            print("Scrolling to #top-influence...")
-            try:
-                # Need to wait for element to be present
-                page.wait_for_selector("#top-influence", timeout=30000)
-                page.locator("#top-influence").scroll_into_view_if_needed()
-                time.sleep(3) # Wait for animation/render
-            except Exception as e:
-                print(f"Could not scroll to element: {e}")
+            with span(SCRAPER, "extract", part="series"):
+                series_data = read_series_data(page, chart_ids)
+        except Exception as e:
+            print(f"Error reading chart series: {e}")
+            series_data = {}
 
-            # Define charts to scrape
-            charts_to_scrape = [
-                {"id": "top-influence-1", "title": "VN-INDEX"},
-                {"id": "top-influence-4", "title": "VN30-INDEX"},
-                {"id": "top-influence-2", "title": "HNX-INDEX"}
-            ]
+        missing = [c for c in CHARTS if c["id"] not in series_data]
+        if missing:
+            print(f"No series data for {', '.join(c['title'] for c in missing)}, reading data labels instead.")
+            # Wait for animation/render: every chart has its data labels drawn
+            wait_for_condition(page, SCRAPER, """(ids) => ids.every(id =>
+                document.querySelectorAll(`#${id} .highcharts-data-labels span`).length > 0)""",
+                3, "chart render", arg=[c["id"] for c in missing])
 
-            for chart_info in charts_to_scrape:
-                data = parse_chart_data(page, chart_info["id"], chart_info["title"])
-                if data:
-                    report_content.append(format_table(data, chart_info["title"]))
-                else:
-                    report_content.append(f"### {chart_info['title']}\n*Could not extract data.*\n\n")
+        for chart_info in CHARTS:
+            data = series_data.get(chart_info["id"])
+            if data:
+                print(f"{chart_info['title']}: {len(data['gainers'])} gainers, {len(data['losers'])} losers from chart series.")
+            else:
+                with span(SCRAPER, "extract", part=chart_info["title"]):
+                    data = parse_chart_data(page, chart_info["id"], chart_info["title"])
+            if data:
+                add_chart_table(doc, data, chart_info["title"])
+            else:
+                report_schema.add_text(doc, "*Could not extract data.*", title=chart_info["title"])
 
-        except Exception as e:
-            print(f"Global error: {e}")
-            report_content.append(f"\n# Error Occurred\n{e}\n")
-        finally:
-            browser.close()
+    except Exception as e:
+        print(f"Global error: {e}")
+        report_schema.add_text(doc, str(e), title="Error Occurred", level=1)
+    finally:
+        page.close()
+        blocker.report()
+
+    return report_schema.save_report(doc, OUTPUT_DIR, "top_influence")
 
-    # Save to file
-    full_content = "".join(report_content)
-    save_markdown(full_content, date_str, time_str)
+def run(context):
+    """Importable entry point for the shared-browser runner. Returns the saved path."""
+    return analyze_top_influence(context=context)
 
 if __name__ == "__main__":
     analyze_top_influence()
+
@@ -0,0 +1,186 @@
+import os
+import re
+import json
+import time
+from tracing import emit_span
+
+# --- Configuration ---
+# CAPTURE_XHR=0 skips the JSON payloads and always scrapes the rendered DOM
+CAPTURE_ENABLED = os.getenv("CAPTURE_XHR", "1") != "0"
+# When set, every captured JSON payload is written there (one file per response) to pin endpoints/fields
+XHR_DUMP_DIR = os.getenv("XHR_DUMP_DIR")
+
+STOCK_CODE = re.compile(r"^[A-Z0-9]{3}$")
+# Field names tried, in order, for the stock code and the net value of a top buy/sell record
+CODE_KEYS = ["StockCode", "Code", "Symbol", "Ticker"]
+NET_VALUE_KEYS = ["NetVal", "NetValue", "NetBuySellVal", "NetTradeVal", "Value", "Val"]
+
+class JsonCapture:
+    """
+    Collects the JSON bodies of a page's XHR/fetch responses, starting before navigation so the
+    payloads that fill the charts and tables are not missed.
+        capture = JsonCapture(page, SCRAPER)
+        fresh_goto(page, SCRAPER, URL)
+        data = capture.wait_for(parse_payloads, timeout=15)
+    """
+
+    def __init__(self, page, scraper, url_pattern=None):
+        self.page = page
+        self.scraper = scraper
+        self.pattern = re.compile(url_pattern) if url_pattern else None
+        self.payloads = []
+        self.inflight = set()
+        self.seen = 0
+        self.last_change = time.perf_counter()
+        page.on("request", self._on_request)
+        page.on("requestfinished", self._on_done)
+        page.on("requestfailed", self._on_done)
+
+    def _matches(self, request):
+        if request.resource_type not in ("xhr", "fetch"):
+            return False
+        return self.pattern is None or bool(self.pattern.search(request.url))
+
+    def _on_request(self, request):
+        if self._matches(request):
+            self.inflight.add(request)
+            self.seen += 1
+            self.last_change = time.perf_counter()
+
+    def _on_done(self, request):
+        if request not in self.inflight:
+            return
+        self.inflight.discard(request)
+        self.last_change = time.perf_counter()
+        response = request.response() if request.failure is None else None
+        if response is None or "json" not in response.headers.get("content-type", ""):
+            return
+        try:
+            body = response.json()
+        except Exception:
+            return
+        self.payloads.append({"url": request.url, "json": body})
+        if XHR_DUMP_DIR:
+            self._dump(request, body)
+
+    def _dump(self, request, body):
+        os.makedirs(XHR_DUMP_DIR, exist_ok=True)
+        path = os.path.join(XHR_DUMP_DIR, f"{self.scraper}_{len(self.payloads):03d}.json")
+        record = {"scraper": self.scraper, "url": request.url, "method": request.method,
+                  "post_data": request.post_data, "referer": request.headers.get("referer"), "json": body}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+
+    def wait_for(self, parse, timeout=15, quiet_ms=1000, grace=2, no_response=5):
+        """
+        Call parse(payloads) as responses arrive until it returns data. Gives up (returns None)
+        once the page has had no JSON request in flight for `quiet_ms` - by then every payload
+        that could match has arrived. A page that fires no JSON request at all gets `grace`
+        seconds, and with no JSON response after `no_response` seconds (the old fixed delay)
+        the DOM is used; `timeout` only bounds a page that keeps answering.
+        """
+        t0 = time.perf_counter()
+        result = None
+        while time.perf_counter() - t0 < timeout:
+            result = parse(self.payloads) if self.payloads else None
+            if result:
+                break
+            now = time.perf_counter()
+            quiet = not self.inflight and (now - self.last_change) * 1000 >= quiet_ms
+            if quiet and (self.seen or now - t0 >= grace):
+                break
+            if not self.payloads and now - t0 >= no_response:
+                break
+            # wait_for_timeout (not time.sleep) so Playwright keeps dispatching response events
+            self.page.wait_for_timeout(50)
+        elapsed = time.perf_counter() - t0
+        if result:
+            print(f"[xhr] data read from {len(self.payloads)} JSON response(s) in {elapsed:.2f}s")
+        else:
+            urls = ", ".join(p["url"].split("?")[0] for p in self.payloads) or "none"
+            print(f"[xhr] no matching payload after {elapsed:.2f}s (JSON responses seen: {urls}), using the DOM")
+        emit_span(self.scraper, "xhr", elapsed, matched=bool(result), responses=len(self.payloads))
+        return result
+
+    def close(self):
+        self.page.remove_listener("request", self._on_request)
+        self.page.remove_listener("requestfinished", self._on_done)
+        self.page.remove_listener("requestfailed", self._on_done)
+
+# --- Payload helpers ---
+
+def record_lists(node):
+    """Yield every list of dicts found anywhere in a JSON payload."""
+    if isinstance(node, list):
+        if node and all(isinstance(item, dict) for item in node):
+            yield node
+        for item in node:
+            yield from record_lists(item)
+    elif isinstance(node, dict):
+        for value in node.values():
+            yield from record_lists(value)
+
+def pick_key(record, candidates):
+    """First of `candidates` present in `record`, compared case-insensitively."""
+    keys = {k.lower(): k for k in record}
+    for name in candidates:
+        if name.lower() in keys:
+            return keys[name.lower()]
+    return None
+
+def to_number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.replace(",", ""))
+        except ValueError:
+            return None
+    return None
+
+def stock_value_lists(payloads, code_keys, value_keys):
+    """
+    Every list of {stock code, number} records in the payloads, as [{'code', 'value'}] lists.
+    A list only counts if all its records have a 3-character stock code and a numeric value.
+    """
+    found = []
+    for payload in payloads:
+        for records in record_lists(payload["json"]):
+            code_key = pick_key(records[0], code_keys)
+            value_key = pick_key(records[0], value_keys)
+            if not code_key or not value_key:
+                continue
+            items = [{"code": r.get(code_key), "value": to_number(r.get(value_key))} for r in records]
+            if all(isinstance(i["code"], str) and STOCK_CODE.match(i["code"]) and i["value"] is not None for i in items):
+                found.append(items)
+    return found
+
+def in_billions(items):
+    """Payloads may carry raw VND while the charts show billions; the top lists never reach 1e6 billion."""
+    if items and max(abs(i["value"]) for i in items) >= 1e6:
+        return [{"code": i["code"], "value": i["value"] / 1e9} for i in items]
+    return items
+
+def split_top_lists(lists):
+    """
+    Turn the stock lists of a net buy/sell payload into (top_buy, top_sell), or None if ambiguous:
+    either two lists, one all net buys (>= 0) and one all net sells (<= 0),
+    or a single list holding both, split by sign.
+    """
+    signed = [l for l in lists if l and (all(i["value"] >= 0 for i in l) or all(i["value"] <= 0 for i in l))]
+    buys = [l for l in signed if any(i["value"] > 0 for i in l)]
+    sells = [l for l in signed if any(i["value"] < 0 for i in l)]
+    if len(buys) == 1 and len(sells) == 1:
+        return in_billions(buys[0]), in_billions(sells[0])
+
+    mixed = [l for l in lists if any(i["value"] > 0 for i in l) and any(i["value"] < 0 for i in l)]
+    if len(mixed) == 1:
+        items = in_billions(mixed[0])
+        top_buy = sorted((i for i in items if i["value"] > 0), key=lambda i: i["value"], reverse=True)
+        top_sell = sorted((i for i in items if i["value"] < 0), key=lambda i: i["value"])
+        return top_buy, top_sell
+    return None
+
+def top_buy_sell(payloads):
+    """(top_buy, top_sell) from the net buy/sell payloads of the foreign / proprietary pages, or None."""
+    return split_top_lists(stock_value_lists(payloads, CODE_KEYS, NET_VALUE_KEYS))